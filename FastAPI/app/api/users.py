@@ -89,27 +89,23 @@ def create_admin(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return new_admin
 
 
+@router.post("/bulk-delete", response_model=schemas.UserBulkDeleteOut, dependencies=[Depends(get_current_admin)])
+def delete_customers(payload: schemas.UserBulkDelete, db: Session = Depends(get_db)):
+    """
+    Delete several users (customers) along with all orders linked to them.
+    Only an admin can perform this action.
+    Product inventory is restored for every deleted order item; unknown ids are ignored.
+    """
+    deleted = crud.delete_users(db, payload.user_ids)
+    return {"deleted": deleted}
+
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(get_current_admin)])
 def delete_customer(user_id: int, db: Session = Depends(get_db)):
     """
     Delete a user (customer) along with all orders linked to that user.
     Only an admin can perform this action.
-    For each order, the associated product inventory is restored.
+    The product inventory of every order item is restored in the same transaction.
     """
-    user = crud.get_user(db, user_id)
-    if not user:
+    if not crud.delete_user(db, user_id):
         raise HTTPException(status_code=404, detail="User not found")
-
-    # Delete all orders linked to this user and restore product counts.
-    # It's important to iterate over a copy of the orders list since the deletion
-    # may modify the relationship.
-    for order in list(user.orders):
-        # Use the existing delete_order function to handle inventory restoration.
-        success = crud.delete_order(db, order.id)
-        if not success:
-            raise HTTPException(status_code=400, detail=f"Failed to delete order with id {order.id}")
-
-    # Now delete the user record.
-    db.delete(user)
-    db.commit()
     return None
\ No newline at end of file
@@ -1,10 +1,17 @@
 # app/crud.py
 
+from fastapi import HTTPException
+from sqlalchemy import bindparam, func, select
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from app import models, schemas
 from app.core.security import get_password_hash  # Assuming this is already implemented
 
+user_table = models.User.__table__
+product_table = models.Product.__table__
+order_table = models.Order.__table__
+order_item_table = models.OrderItem.__table__
+
 # ---------------------------
 # User CRUD Operations
 # ---------------------------
@@ -30,6 +37,39 @@ def create_user(db: Session, user: schemas.UserCreate, role: str = "customer") -
     db.refresh(db_user)
     return db_user
 
+def delete_users(db: Session, user_ids: List[int]) -> int:
+    """
+    Delete users along with all their orders in a single transaction by:
+      1. Restoring the product count for all their order items with one grouped UPDATE.
+      2. Removing their order items, orders and user records with one DELETE each.
+    Returns the number of users deleted.
+    """
+    # Only existing users; orders pointing at unknown user ids are left alone
+    user_ids = db.execute(select(user_table.c.id).where(user_table.c.id.in_(set(user_ids)))).scalars().all()
+    if not user_ids:
+        db.rollback()
+        return 0
+    user_order_ids = select(order_table.c.id).where(order_table.c.user_id.in_(user_ids))
+    user_items = order_item_table.c.order_id.in_(user_order_ids)
+    ordered = (
+        select(func.sum(order_item_table.c.quantity))
+        .where(user_items, order_item_table.c.product_id == product_table.c.id)
+        .scalar_subquery()
+    )
+    db.execute(
+        product_table.update()
+        .where(product_table.c.id.in_(select(order_item_table.c.product_id).where(user_items)))
+        .values(count=product_table.c.count + ordered)
+    )
+    db.execute(order_item_table.delete().where(user_items))
+    db.execute(order_table.delete().where(order_table.c.user_id.in_(user_ids)))
+    deleted = db.execute(user_table.delete().where(user_table.c.id.in_(user_ids))).rowcount
+    db.commit()
+    return deleted
+
+def delete_user(db: Session, user_id: int) -> bool:
+    return delete_users(db, [user_id]) == 1
+
 # ---------------------------
 # Product CRUD Operations
 # ---------------------------
@@ -103,39 +143,79 @@ def create_order(db: Session, user_id: int, order: schemas.OrderCreate) -> model
     return db_order
 def update_order(db: Session, order_id: int, new_order: schemas.OrderCreate) -> Optional[models.Order]:
     """
-    Update an order by:
-      1. Restoring the product count for all items in the existing order.
-      2. Removing the old order items.
-      3. Adding new order items and deducting product count accordingly.
+    Update an order in a single transaction by:
+      1. Comparing the existing and the new quantity of each product.
+      2. Taking stock for increases with one conditional UPDATE and returning stock for decreases.
+      3. Updating, inserting or deleting only the order items of products whose quantity changed.
+    If any product lacks inventory, nothing is changed.
     """
-    existing_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not existing_order:
+    # Write to the order first: this takes the write lock, so a concurrent update of the same
+    # order waits here instead of computing its difference from items that are being replaced.
+    if not db.execute(
+        order_table.update().where(order_table.c.id == order_id).values(user_id=order_table.c.user_id)
+    ).rowcount:
+        db.rollback()
         return None
 
-    # Restore inventory for all existing order items
-    for item in existing_order.order_items:
-        product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
-        if product:
-            product.count += item.quantity  # restore count
-        db.delete(item)  # remove the existing order item
-    db.commit()
-
-    # Process new order items
+    old_items: Dict[int, List[Tuple[int, int]]] = {}  # product_id -> [(item id, quantity)]
+    for item_id, product_id, quantity in db.execute(
+        select(order_item_table.c.id, order_item_table.c.product_id, order_item_table.c.quantity)
+        .where(order_item_table.c.order_id == order_id)
+        .order_by(order_item_table.c.id)
+    ):
+        old_items.setdefault(product_id, []).append((item_id, quantity))
+    new_quantities: Dict[int, int] = {}
     for new_item in new_order.order_items:
-        product = db.query(models.Product).filter(models.Product.id == new_item.product_id).first()
-        if not product or product.count < new_item.quantity:
-            db.rollback()
-            raise HTTPException(status_code=400, detail="Insufficient inventory for product ID {}".format(new_item.product_id))
-        product.count -= new_item.quantity
-        db_order_item = models.OrderItem(
-            order_id=order_id,
-            product_id=new_item.product_id,
-            quantity=new_item.quantity
+        new_quantities[new_item.product_id] = new_quantities.get(new_item.product_id, 0) + new_item.quantity
+    deltas = {}
+    for product_id in list(new_quantities) + [product_id for product_id in old_items if product_id not in new_quantities]:
+        delta = new_quantities.get(product_id, 0) - sum(quantity for _, quantity in old_items.get(product_id, []))
+        if delta:
+            deltas[product_id] = delta
+
+    # Deduct only where enough is left at write time, so concurrent orders can't oversell
+    taken = {product_id: delta for product_id, delta in deltas.items() if delta > 0}
+    if taken and db.execute(
+        product_table.update()
+        .where(product_table.c.id == bindparam("b_product_id"), product_table.c.count >= bindparam("b_quantity"))
+        .values(count=product_table.c.count - bindparam("b_quantity")),
+        [{"b_product_id": product_id, "b_quantity": quantity} for product_id, quantity in taken.items()],
+    ).rowcount != len(taken):
+        db.rollback()
+        stock = dict(db.execute(select(product_table.c.id, product_table.c.count).where(product_table.c.id.in_(list(taken)))).all())
+        short_product_id = next((product_id for product_id, quantity in taken.items() if (stock.get(product_id) or 0) < quantity), next(iter(taken)))
+        raise HTTPException(status_code=400, detail="Insufficient inventory for product ID {}".format(short_product_id))
+    returned = [{"b_product_id": product_id, "b_quantity": -delta} for product_id, delta in deltas.items() if delta < 0]
+    if returned:
+        db.execute(
+            product_table.update()
+            .where(product_table.c.id == bindparam("b_product_id"))
+            .values(count=product_table.c.count + bindparam("b_quantity")),
+            returned,
+        )
+
+    # One item per changed product carries the new quantity; unchanged products keep their rows
+    updated_items, added_items, removed_item_ids = [], [], []
+    for product_id in deltas:
+        rows = old_items.get(product_id, [])
+        quantity = new_quantities.get(product_id, 0)
+        if quantity and rows:
+            updated_items.append({"b_item_id": rows[0][0], "b_quantity": quantity})
+            rows = rows[1:]
+        elif quantity:
+            added_items.append({"order_id": order_id, "product_id": product_id, "quantity": quantity})
+        removed_item_ids.extend(item_id for item_id, _ in rows)
+    if updated_items:
+        db.execute(
+            order_item_table.update().where(order_item_table.c.id == bindparam("b_item_id")).values(quantity=bindparam("b_quantity")),
+            updated_items,
         )
-        db.add(db_order_item)
+    if added_items:
+        db.execute(order_item_table.insert(), added_items)
+    if removed_item_ids:
+        db.execute(order_item_table.delete().where(order_item_table.c.id.in_(removed_item_ids)))
     db.commit()
-    db.refresh(existing_order)
-    return existing_order
+    return get_order(db, order_id)
 def delete_order(db: Session, order_id: int) -> bool:
     """
     Delete an order and restore the product inventory based on the order items.
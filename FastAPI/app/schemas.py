@@ -1,6 +1,6 @@
 # app/schemas.py
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, conlist
 from typing import List, Optional
 
 # ---------------------------
@@ -27,6 +27,12 @@ class UserUpdate(BaseModel):
     class Config:
         orm_mode = True
 
+class UserBulkDelete(BaseModel):
+    user_ids: conlist(int, max_items=1000) # Bounds the IN lists and the single transaction
+
+class UserBulkDeleteOut(BaseModel):
+    deleted: int
+
 # ---------------------------
 # Category Schemas
 # ---------------------------
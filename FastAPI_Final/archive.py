@@ -0,0 +1,76 @@
+# archive.py
+import sys
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import literal, select
+from sqlalchemy.orm import Session
+
+import models
+
+ARCHIVE_AFTER_DAYS = 365 # Final orders older than this leave the hot tables
+ARCHIVE_STATUSES = (models.OrderStatus.DELIVERED, models.OrderStatus.CANCELLED) # No transitions out of these
+ARCHIVE_CHUNK_SIZE = 500 # Orders moved per transaction
+ARCHIVE_INTERVAL_SECONDS = 24 * 60 * 60
+
+order_table = models.Order.__table__
+line_item_table = models.OrderLineItem.__table__
+archived_order_table = models.ArchivedOrder.__table__
+archived_line_item_table = models.ArchivedOrderLineItem.__table__
+
+
+def archive_orders(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, chunk_size: int = ARCHIVE_CHUNK_SIZE, max_chunks: Optional[int] = None) -> int:
+    """
+    Move delivered and cancelled orders placed more than `older_than_days` ago, with their line
+    items, to archived_orders / archived_order_line_items. Each chunk is copied and deleted in its
+    own transaction, so writers are never blocked for long and an interrupted run loses nothing.
+    Returns the number of orders archived.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    # orders and order_line_items use AUTOINCREMENT, but tables created before that could hand out
+    # an archived id again. Such orders stay hot rather than collide with the archived rows.
+    already_archived = (
+        select(archived_order_table.c.id).where(archived_order_table.c.id == order_table.c.id).exists()
+        | select(line_item_table.c.id)
+        .select_from(line_item_table.join(archived_line_item_table, archived_line_item_table.c.id == line_item_table.c.id))
+        .where(line_item_table.c.order_id == order_table.c.id)
+        .exists()
+    )
+    archived = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        order_ids = db.execute(
+            select(order_table.c.id)
+            .where(order_table.c.status.in_(ARCHIVE_STATUSES), order_table.c.order_date < cutoff, ~already_archived)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not order_ids:
+            break
+        db.execute(archived_order_table.insert().from_select(
+            ["id", "user_id", "order_date", "status", "archived_at"],
+            select(order_table.c.id, order_table.c.user_id, order_table.c.order_date, order_table.c.status, literal(datetime.utcnow()))
+            .where(order_table.c.id.in_(order_ids)),
+        ))
+        db.execute(archived_line_item_table.insert().from_select(
+            ["id", "order_id", "product_id", "category_id", "quantity", "price"],
+            select(line_item_table.c.id, line_item_table.c.order_id, line_item_table.c.product_id, line_item_table.c.category_id, line_item_table.c.quantity, line_item_table.c.price)
+            .where(line_item_table.c.order_id.in_(order_ids)),
+        ))
+        db.execute(line_item_table.delete().where(line_item_table.c.order_id.in_(order_ids)))
+        db.execute(order_table.delete().where(order_table.c.id.in_(order_ids)))
+        db.commit()
+        archived += len(order_ids)
+        chunks += 1
+    return archived
+
+
+if __name__ == "__main__": # python archive.py [older_than_days]
+    from database import SessionLocal, engine
+    if len(sys.argv) > 2 or (len(sys.argv) == 2 and not sys.argv[1].isdigit()):
+        sys.exit("usage: python archive.py [older_than_days]")
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        moved = archive_orders(db, int(sys.argv[1]) if len(sys.argv) == 2 else ARCHIVE_AFTER_DAYS)
+    finally:
+        db.close()
+    print(f"Archived {moved} orders")
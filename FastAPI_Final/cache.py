@@ -0,0 +1,163 @@
+# cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Set, Tuple
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache for serialized responses (JSON bytes) with a TTL.
+    Every entry carries a set of tags (e.g. category ids) so writers can drop
+    exactly the entries they affect instead of flushing the whole cache.
+    Readers that fill the cache take generation() before computing a body and pass it to set(),
+    which drops the body if one of its tags was invalidated in the meantime.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 60.0, max_tracked_tags: int = 4096):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_tracked_tags = max_tracked_tags
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, float, Tuple[Hashable, ...]]]" = OrderedDict()
+        self._tag_index: Dict[Hashable, Set[Hashable]] = {}
+        self._bytes = 0
+        self._generation = 0 # Bumped by every invalidation
+        self._invalidated_at: "OrderedDict[Hashable, int]" = OrderedDict() # Tag -> generation of its last invalidation, oldest first
+        self._forgotten_through = 0 # Newest generation dropped from _invalidated_at
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            body, expires_at, _ = entry
+            if expires_at <= time.monotonic(): # Expired entries count as misses
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def generation(self) -> int:
+        """
+        Take before computing a body to cache and pass to set().
+        """
+        with self._lock:
+            return self._generation
+
+    def set(self, key: Hashable, body: bytes, tags: Iterable[Hashable] = (), generation: Optional[int] = None) -> None:
+        if len(body) > self.max_bytes:
+            return # Never cache something that would evict everything else
+        tags = tuple(tags)
+        with self._lock:
+            if generation is not None and self._invalidated_since(generation, tags):
+                self.stale_fills += 1 # Computed from data a writer has changed since
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, time.monotonic() + self.ttl_seconds, tags)
+            self._bytes += len(body)
+            for tag in tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate_tags(self, *tags: Hashable) -> int:
+        """
+        Drop every entry carrying any of the given tags. Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            self._generation += 1
+            for tag in set(tags):
+                for key in list(self._tag_index.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+                self._invalidated_at.pop(tag, None)
+                self._invalidated_at[tag] = self._generation
+            while len(self._invalidated_at) > self.max_tracked_tags:
+                _, forgotten = self._invalidated_at.popitem(last=False)
+                self._forgotten_through = forgotten
+            self.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tag_index.clear()
+            self._bytes = 0
+            self._generation += 1
+            self._invalidated_at.clear()
+            self._forgotten_through = self._generation # Fills started before this are dropped
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_fills": self.stale_fills,
+            }
+
+    def _invalidated_since(self, generation: int, tags: Tuple[Hashable, ...]) -> bool:
+        # Caller must hold the lock. Tags no longer tracked may have been invalidated up to _forgotten_through.
+        if generation < self._forgotten_through:
+            return True
+        return any(self._invalidated_at.get(tag, 0) > generation for tag in tags)
+
+    def _remove(self, key: Hashable) -> None:
+        # Caller must hold the lock
+        body, _, tags = self._entries.pop(key)
+        self._bytes -= len(body)
+        for tag in tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+
+# --- Product Listing Cache ---
+# Listings are tagged with the category they are filtered on; unfiltered listings
+# (which can contain products of any category) are tagged with ALL_CATEGORIES.
+ALL_CATEGORIES = "*"
+
+product_list_cache = ResponseCache(max_entries=2048, max_bytes=64 * 1024 * 1024, ttl_seconds=60.0)
+
+
+def invalidate_product_listings(*category_ids: Optional[int]) -> None:
+    """
+    Invalidate cached product listings affected by a change to products in the given categories.
+    """
+    product_list_cache.invalidate_tags(ALL_CATEGORIES, *(("category", cid) for cid in category_ids if cid is not None))
+
+
+# --- Cart Summary Cache ---
+# One entry per user, keyed and tagged by username so a hit needs no database access at all.
+cart_summary_cache = ResponseCache(max_entries=10000, max_bytes=16 * 1024 * 1024, ttl_seconds=300.0)
+
+
+def invalidate_cart_summary(username: str) -> None:
+    """
+    Drop the cached cart summary of a user; call after every change to their cart.
+    """
+    cart_summary_cache.invalidate_tags(("cart", username))
\ No newline at end of file
@@ -0,0 +1,455 @@
+# cart_store.py
+# Cart lines live behind a small interface so the storage can be swapped without touching the
+# cart endpoints or checkout: SqlCartStore keeps them in the order_items table (the default),
+# MemoryCartStore keeps them in process memory with a write-ahead journal and periodic write-back.
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+import orjson
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, joinedload
+
+import idempotency
+import models
+import serialization
+from database import SessionLocal
+
+CART_STORE_BACKEND = "sql" # "sql" or "memory"
+CART_JOURNAL_DIR = "./cart_journal" # Memory backend: journal segments not yet written back
+JOURNAL_FSYNC = False # fsync every journal append (survives power loss, not just process crashes)
+WRITE_BACK_INTERVAL_SECONDS = 5
+WRITE_BACK_CHUNK_SIZE = 500
+
+
+class CartStore(ABC):
+    """
+    Storage for cart lines. Lines expose id, user_id, product_id, quantity, price, order_id and
+    (when loaded with products) product, so they serialize with schemas.OrderItemSchema.
+    Writes join the session's transaction and take effect when the caller commits.
+    """
+
+    @abstractmethod
+    def get_lines(self, db: Session, user_id: int, with_products: bool = False) -> list:
+        ...
+
+    @abstractmethod
+    def get_line(self, db: Session, user_id: int, line_id: int):
+        """
+        One of the user's lines with its product loaded, or None.
+        """
+
+    @abstractmethod
+    def find_lines(self, db: Session, user_id: int, product_ids: Iterable[int], with_products: bool = False) -> Dict[int, object]:
+        """
+        The user's lines for the given products, keyed by product id.
+        """
+
+    @abstractmethod
+    def set_quantities(self, db: Session, user_id: int, quantities: Dict[int, int], prices: Dict[int, float]) -> None:
+        """
+        Set absolute line quantities per product: missing lines are added at `prices[product_id]`,
+        existing lines keep their price, and quantity 0 removes the line.
+        """
+
+    @abstractmethod
+    def remove_lines(self, db: Session, user_id: int, line_ids: List[int]) -> int:
+        """
+        Remove the given lines; returns how many were removed, so a concurrent checkout of the
+        same cart can be detected (only one of them removes every line).
+        """
+
+    @abstractmethod
+    def summary(self, db: Session, username: str) -> Optional[dict]:
+        """
+        Cart totals shaped like schemas.CartSummarySchema, or None if the user does not exist.
+        """
+
+    def write_back(self, db: Session) -> int:
+        return 0 # Nothing buffered
+
+
+class SqlCartStore(CartStore):
+    """
+    Cart lines as rows of the order_items table.
+    """
+
+    def get_lines(self, db: Session, user_id: int, with_products: bool = False) -> list:
+        query = db.query(models.OrderItem).filter(models.OrderItem.user_id == user_id)
+        if with_products:
+            query = query.options(joinedload(models.OrderItem.product).joinedload(models.Product.category)) # One query instead of two per row
+        return query.all()
+
+    def get_line(self, db: Session, user_id: int, line_id: int):
+        return (
+            db.query(models.OrderItem)
+            .options(joinedload(models.OrderItem.product).joinedload(models.Product.category))
+            .filter(models.OrderItem.id == line_id, models.OrderItem.user_id == user_id)
+            .first()
+        )
+
+    def find_lines(self, db: Session, user_id: int, product_ids: Iterable[int], with_products: bool = False) -> Dict[int, object]:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return {}
+        query = db.query(models.OrderItem).filter(models.OrderItem.user_id == user_id, models.OrderItem.product_id.in_(product_ids))
+        if with_products:
+            query = query.options(joinedload(models.OrderItem.product).joinedload(models.Product.category))
+        lines = {}
+        for line in query:
+            lines.setdefault(line.product_id, line)
+        return lines
+
+    def set_quantities(self, db: Session, user_id: int, quantities: Dict[int, int], prices: Dict[int, float]) -> None:
+        existing = self.find_lines(db, user_id, quantities)
+        removed_product_ids = [product_id for product_id, quantity in quantities.items() if quantity == 0]
+        if removed_product_ids:
+            db.query(models.OrderItem).filter(
+                models.OrderItem.user_id == user_id, models.OrderItem.product_id.in_(removed_product_ids)
+            ).delete(synchronize_session=False)
+        new_lines = []
+        for product_id, quantity in quantities.items():
+            if quantity == 0:
+                continue
+            if product_id in existing:
+                existing[product_id].quantity = quantity # Flushed as one executemany UPDATE
+            else:
+                new_lines.append({"user_id": user_id, "product_id": product_id, "quantity": quantity, "price": prices[product_id]})
+        if new_lines:
+            db.execute(models.OrderItem.__table__.insert(), new_lines)
+        db.flush()
+
+    def remove_lines(self, db: Session, user_id: int, line_ids: List[int]) -> int:
+        if not line_ids:
+            return 0
+        return db.query(models.OrderItem).filter(
+            models.OrderItem.id.in_(line_ids), models.OrderItem.user_id == user_id
+        ).delete(synchronize_session=False)
+
+    def summary(self, db: Session, username: str) -> Optional[dict]:
+        # One aggregate query: window functions over the user's lines, user lookup folded into the join
+        line_total = models.OrderItem.quantity * models.OrderItem.price
+        rows = (
+            db.query(
+                models.OrderItem.product_id,
+                models.OrderItem.quantity,
+                models.OrderItem.price,
+                func.round(line_total, 2),
+                func.count(models.OrderItem.id).over(),
+                func.coalesce(func.sum(models.OrderItem.quantity).over(), 0),
+                func.coalesce(func.round(func.sum(line_total).over(), 2), 0.0),
+            )
+            .select_from(models.User)
+            .outerjoin(models.OrderItem, models.OrderItem.user_id == models.User.id) # One row with NULLs for an empty cart
+            .filter(models.User.username == username)
+            .order_by(models.OrderItem.id)
+            .all()
+        )
+        if not rows:
+            return None
+        _, _, _, _, line_count, item_count, total = rows[0]
+        return {
+            "lines": [
+                {"product_id": product_id, "quantity": quantity, "unit_price": price, "line_total": row_total}
+                for product_id, quantity, price, row_total, _, _, _ in rows
+                if product_id is not None
+            ],
+            "line_count": line_count,
+            "item_count": item_count,
+            "total": total,
+        }
+
+
+class CartLine:
+    """
+    In-memory cart line; same attributes as models.OrderItem.
+    """
+    __slots__ = ("id", "user_id", "product_id", "quantity", "price", "order_id", "product")
+
+    def __init__(self, id: int, user_id: int, product_id: int, quantity: int, price: float):
+        self.id = id
+        self.user_id = user_id
+        self.product_id = product_id
+        self.quantity = quantity
+        self.price = price
+        self.order_id = None
+        self.product = None
+
+    def copy(self, quantity: Optional[int] = None) -> "CartLine":
+        return CartLine(self.id, self.user_id, self.product_id, self.quantity if quantity is None else quantity, self.price)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "user_id": self.user_id, "product_id": self.product_id, "quantity": self.quantity, "price": self.price}
+
+
+class MemoryCartStore(CartStore):
+    """
+    Cart lines held in memory; cart writes never touch the order_items table on the request path.
+
+    Changes staged by a session are applied and appended to a journal segment in the session's
+    before_commit hook, i.e. before the database commit (write-ahead): a crash between the two can
+    only lose a cart change or drop the lines of an order that was not placed, never resurrect the
+    lines of a placed order. A failed commit restores the previous lines. write_back() periodically
+    copies the carts changed since the last write-back into order_items in one transaction and then
+    deletes the journal segments it covered; on startup the table is loaded and the remaining
+    segments are replayed. Journal entries are absolute line states, so replay is idempotent.
+
+    The journal append is not part of the database transaction, so changes made under an
+    Idempotency-Key are journaled with that key and replayed only if the key's stored response was
+    committed with them: a crash between the two drops the cart change together with the claim,
+    and the retry runs it once. Reads within a session see its staged changes.
+    """
+
+    def __init__(self, journal_dir: str = CART_JOURNAL_DIR, fsync: bool = JOURNAL_FSYNC):
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self.loaded = False
+        self._carts: Dict[int, Dict[int, CartLine]] = {} # user_id -> product_id -> line
+        self._claimed: set = set() # Line ids being removed by an uncommitted checkout
+        self._dirty: set = set() # Users changed since the last write-back
+        self._next_id = 1
+        self._segment = 0
+        self._journal = None
+        self._lock = threading.RLock()
+        self._info_key = f"cart_store_{id(self)}" # Prefix of this store's entries in Session.info
+        event.listen(SessionLocal, "before_commit", self._before_commit)
+        event.listen(SessionLocal, "after_commit", self._after_commit)
+        event.listen(SessionLocal, "after_rollback", self._after_rollback)
+
+    # --- Loading and journal ---
+    def ensure_loaded(self, db: Session) -> None:
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            for line_id, user_id, product_id, quantity, price in db.query(
+                models.OrderItem.id, models.OrderItem.user_id, models.OrderItem.product_id, models.OrderItem.quantity, models.OrderItem.price
+            ):
+                self._carts.setdefault(user_id, {}).setdefault(product_id, CartLine(line_id, user_id, product_id, quantity, price))
+                self._next_id = max(self._next_id, line_id + 1)
+            os.makedirs(self.journal_dir, exist_ok=True)
+            entries = []
+            for segment in self._segments():
+                with open(self._segment_path(segment), "rb") as journal:
+                    entries.extend(orjson.loads(entry) for entry in journal if entry.strip())
+                self._segment = max(self._segment, segment)
+            committed = self._committed_keys(db, {tuple(entry["idempotency"]) for entry in entries if "idempotency" in entry})
+            for entry in entries:
+                if "idempotency" not in entry or tuple(entry["idempotency"]) in committed:
+                    self._replay(entry)
+            self._segment += 1
+            self._journal = open(self._segment_path(self._segment), "ab")
+            self.loaded = True
+
+    def _committed_keys(self, db: Session, keys: set) -> set:
+        # Idempotency keys whose response was stored, i.e. whose transaction committed
+        key_table = idempotency.key_table
+        committed = set()
+        for user_id, key in keys:
+            if db.query(key_table.c.id).filter(key_table.c.user_id == user_id, key_table.c.key == key, key_table.c.response_status.isnot(None)).first():
+                committed.add((user_id, key))
+        return committed
+
+    def _segments(self) -> List[int]:
+        return sorted(int(name[len("segment-"):-len(".jsonl")]) for name in os.listdir(self.journal_dir) if name.startswith("segment-") and name.endswith(".jsonl"))
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.journal_dir, f"segment-{segment:08d}.jsonl")
+
+    def _replay(self, entry: dict) -> None:
+        if entry["op"] == "set":
+            line = CartLine(**entry["line"])
+            self._set(line)
+            self._next_id = max(self._next_id, line.id + 1)
+        else:
+            self._delete(entry["user_id"], entry["product_id"])
+        self._dirty.add(entry["user_id"] if entry["op"] == "del" else entry["line"]["user_id"])
+
+    def _write_journal(self, entries: List[dict]) -> None:
+        # Caller holds the lock
+        self._journal.write(b"".join(serialization.dumps(entry) + b"\n" for entry in entries))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _set(self, line: CartLine) -> None:
+        self._carts.setdefault(line.user_id, {})[line.product_id] = line
+
+    def _delete(self, user_id: int, product_id: int) -> None:
+        cart = self._carts.get(user_id)
+        if cart is not None:
+            cart.pop(product_id, None)
+            if not cart:
+                del self._carts[user_id]
+
+    def _apply(self, changes: List[tuple], idempotency_key: Optional[tuple] = None) -> List[tuple]:
+        # Caller holds the lock; returns the previous state of every touched line for undo
+        previous, entries = [], []
+        for user_id, product_id, line in changes:
+            previous.append((user_id, product_id, self._carts.get(user_id, {}).get(product_id)))
+            if line is None:
+                self._delete(user_id, product_id)
+                entries.append({"op": "del", "user_id": user_id, "product_id": product_id})
+            else:
+                self._set(line)
+                entries.append({"op": "set", "line": line.to_dict()})
+            self._dirty.add(user_id)
+        if idempotency_key is not None:
+            for entry in entries:
+                entry["idempotency"] = list(idempotency_key)
+        self._write_journal(entries)
+        return previous
+
+    # --- Transaction hooks ---
+    def _before_commit(self, session: Session) -> None:
+        changes = session.info.pop(self._info_key + "_changes", None)
+        claimed = session.info.pop(self._info_key + "_claims", ())
+        if not changes:
+            return
+        with self._lock:
+            session.info[self._info_key + "_undo"] = self._apply(changes, session.info.get(idempotency.KEY_INFO))
+            self._claimed.difference_update(claimed)
+
+    def _after_commit(self, session: Session) -> None:
+        session.info.pop(self._info_key + "_undo", None)
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop(self._info_key + "_changes", None)
+        claimed = session.info.pop(self._info_key + "_claims", ())
+        undo = session.info.pop(self._info_key + "_undo", None)
+        with self._lock:
+            self._claimed.difference_update(claimed)
+            if undo:
+                self._apply(list(reversed(undo)))
+
+    def _stage(self, db: Session, user_id: int, product_id: int, line: Optional[CartLine]) -> None:
+        db.info.setdefault(self._info_key + "_changes", []).append((user_id, product_id, line))
+
+    def _cart(self, db: Session, user_id: int) -> Dict[int, CartLine]:
+        # Caller holds the lock; the user's lines with the session's staged changes applied
+        cart = dict(self._carts.get(user_id, {}))
+        for staged_user_id, product_id, line in db.info.get(self._info_key + "_changes", ()):
+            if staged_user_id == user_id:
+                if line is None:
+                    cart.pop(product_id, None)
+                else:
+                    cart[product_id] = line
+        return cart
+
+    # --- CartStore ---
+    def _with_products(self, db: Session, lines: List[CartLine]) -> List[CartLine]:
+        products = {
+            product.id: product
+            for product in db.query(models.Product).options(joinedload(models.Product.category)).filter(models.Product.id.in_({line.product_id for line in lines}))
+        } if lines else {}
+        loaded = []
+        for line in lines:
+            line = line.copy()
+            line.product = products.get(line.product_id)
+            loaded.append(line)
+        return loaded
+
+    def get_lines(self, db: Session, user_id: int, with_products: bool = False) -> list:
+        self.ensure_loaded(db)
+        with self._lock:
+            lines = sorted(self._cart(db, user_id).values(), key=lambda line: line.id)
+        return self._with_products(db, lines) if with_products else [line.copy() for line in lines]
+
+    def get_line(self, db: Session, user_id: int, line_id: int):
+        self.ensure_loaded(db)
+        with self._lock:
+            line = next((line for line in self._cart(db, user_id).values() if line.id == line_id), None)
+        return self._with_products(db, [line])[0] if line is not None else None
+
+    def find_lines(self, db: Session, user_id: int, product_ids: Iterable[int], with_products: bool = False) -> Dict[int, object]:
+        self.ensure_loaded(db)
+        with self._lock:
+            cart = self._cart(db, user_id)
+            lines = [cart[product_id] for product_id in product_ids if product_id in cart]
+        lines = self._with_products(db, lines) if with_products else [line.copy() for line in lines]
+        return {line.product_id: line for line in lines}
+
+    def set_quantities(self, db: Session, user_id: int, quantities: Dict[int, int], prices: Dict[int, float]) -> None:
+        self.ensure_loaded(db)
+        with self._lock:
+            cart = self._cart(db, user_id)
+            for product_id, quantity in quantities.items():
+                line = cart.get(product_id)
+                if quantity == 0:
+                    if line is not None:
+                        self._stage(db, user_id, product_id, None)
+                elif line is not None:
+                    self._stage(db, user_id, product_id, line.copy(quantity=quantity))
+                else:
+                    self._stage(db, user_id, product_id, CartLine(self._next_id, user_id, product_id, quantity, prices[product_id]))
+                    self._next_id += 1
+
+    def remove_lines(self, db: Session, user_id: int, line_ids: List[int]) -> int:
+        self.ensure_loaded(db)
+        line_ids = set(line_ids)
+        with self._lock:
+            lines = [line for line in self._cart(db, user_id).values() if line.id in line_ids and line.id not in self._claimed]
+            claimed = [line.id for line in lines]
+            self._claimed.update(claimed) # A concurrent checkout of the same lines now removes fewer than it asked for
+        db.info.setdefault(self._info_key + "_claims", []).extend(claimed)
+        for line in lines:
+            self._stage(db, user_id, line.product_id, None)
+        return len(lines)
+
+    def summary(self, db: Session, username: str) -> Optional[dict]:
+        user_id = db.query(models.User.id).filter(models.User.username == username).scalar()
+        if user_id is None:
+            return None
+        lines = self.get_lines(db, user_id)
+        line_totals = [round(line.quantity * line.price, 2) for line in lines]
+        return {
+            "lines": [
+                {"product_id": line.product_id, "quantity": line.quantity, "unit_price": line.price, "line_total": line_total}
+                for line, line_total in zip(lines, line_totals)
+            ],
+            "line_count": len(lines),
+            "item_count": sum(line.quantity for line in lines),
+            "total": round(sum((line.quantity * line.price for line in lines), 0.0), 2),
+        }
+
+    def write_back(self, db: Session) -> int:
+        """
+        Copy every cart changed since the last write-back into order_items (one transaction), then
+        delete the journal segments that are now covered. Returns the number of carts written.
+        """
+        self.ensure_loaded(db)
+        with self._lock:
+            if not self._dirty:
+                return 0
+            user_ids, self._dirty = sorted(self._dirty), set()
+            lines = [line for user_id in user_ids for line in self._carts.get(user_id, {}).values()]
+            covered_segment = self._segment # Later changes go to a new segment
+            self._journal.close()
+            self._segment += 1
+            self._journal = open(self._segment_path(self._segment), "ab")
+        try:
+            order_item_table = models.OrderItem.__table__
+            product_ids = list({line.product_id for line in lines})
+            existing_product_ids = set()
+            for start in range(0, len(product_ids), WRITE_BACK_CHUNK_SIZE):
+                existing_product_ids.update(product_id for (product_id,) in db.query(models.Product.id).filter(models.Product.id.in_(product_ids[start:start + WRITE_BACK_CHUNK_SIZE])))
+            rows = [line.to_dict() for line in lines if line.product_id in existing_product_ids] # Lines of deleted products are dropped
+            for start in range(0, len(user_ids), WRITE_BACK_CHUNK_SIZE):
+                db.execute(order_item_table.delete().where(order_item_table.c.user_id.in_(user_ids[start:start + WRITE_BACK_CHUNK_SIZE])))
+            if rows:
+                db.execute(order_item_table.insert(), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._dirty.update(user_ids) # Retried next time; the old segments are kept until then
+            raise
+        for segment in self._segments():
+            if segment <= covered_segment:
+                os.remove(self._segment_path(segment))
+        return len(user_ids)
+
+
+store: CartStore = MemoryCartStore() if CART_STORE_BACKEND == "memory" else SqlCartStore()
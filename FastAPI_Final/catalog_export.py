@@ -0,0 +1,91 @@
+# catalog_export.py
+import csv
+import io
+import zlib
+from typing import Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+import serialization
+
+EXPORT_BATCH_SIZE = 1000 # Rows fetched from the cursor and flushed to the client at a time
+EXPORT_FORMATS = ("ndjson", "csv")
+CSV_COLUMNS = ("id", "name", "description", "price", "quantity", "category_id", "category_name", "image_url")
+
+
+def _iter_product_rows(db: Session, category_id: Optional[int]):
+    """
+    Walk the catalog with a server-side cursor, joined to categories, without loading ORM objects.
+    """
+    query = (
+        db.query(
+            models.Product.id,
+            models.Product.name,
+            models.Product.description,
+            models.Product.price,
+            models.Product.quantity,
+            models.Product.category_id,
+            models.Category.name.label("category_name"),
+            models.Product.image_url,
+        )
+        .outerjoin(models.Category, models.Category.id == models.Product.category_id)
+        .order_by(models.Product.id)
+        .execution_options(stream_results=True)
+    )
+    if category_id is not None:
+        query = query.filter(models.Product.category_id == category_id)
+    return query.yield_per(EXPORT_BATCH_SIZE)
+
+
+def _iter_ndjson_batches(rows) -> Iterator[bytes]:
+    lines = []
+    for row in rows:
+        lines.append(serialization.dumps({
+            "id": row.id,
+            "name": row.name,
+            "description": row.description,
+            "price": row.price,
+            "quantity": row.quantity,
+            "category": {"id": row.category_id, "name": row.category_name} if row.category_id is not None else None,
+            "image_url": row.image_url,
+        }))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def _iter_csv_batches(rows) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(tuple(row))
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_products(db: Session, file_format: str, compress: bool = False, category_id: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yield the catalog as NDJSON or CSV byte chunks, optionally gzip-compressed on the fly.
+    Memory use is bounded by EXPORT_BATCH_SIZE regardless of catalog size.
+    """
+    rows = _iter_product_rows(db, category_id)
+    batches = _iter_csv_batches(rows) if file_format == "csv" else _iter_ndjson_batches(rows)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None # 16+ → gzip container
+
+    for data in batches:
+        if compressor is None:
+            yield data
+            continue
+        data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,193 @@
+# catalog_import.py
+import codecs
+import csv
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import cache
+import changefeed
+import typeahead
+
+IMPORT_CHUNK_SIZE = 1000 # Rows validated and written per transaction
+IMPORT_FORMATS = ("csv", "jsonl")
+PRODUCT_COLUMNS = ("name", "description", "price", "quantity", "category_id", "image_url")
+
+
+def detect_format(filename: Optional[str], requested_format: Optional[str]) -> Optional[str]:
+    """
+    Resolve the import format from the explicit query parameter or the uploaded file extension.
+    """
+    if requested_format:
+        return requested_format.lower() if requested_format.lower() in IMPORT_FORMATS else None
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    return None
+
+
+def iter_raw_rows(binary_file, file_format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Yield (row_number, row, parse_error) tuples one at a time from a binary file object.
+    Only the current line is held in memory.
+    """
+    text_file = codecs.getreader("utf-8-sig")(binary_file)
+    if file_format == "csv":
+        reader = csv.DictReader(text_file)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(text_file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Each line must be a JSON object"
+            continue
+        yield line_number, row, None
+
+
+def _load_category_map(db: Session) -> Tuple[set, Dict[str, int]]:
+    """
+    Preload every category once so rows never trigger their own category lookup.
+    """
+    category_ids = set()
+    category_ids_by_name = {}
+    for category_id, name in db.query(models.Category.id, models.Category.name):
+        category_ids.add(category_id)
+        category_ids_by_name[name.lower()] = category_id
+    return category_ids, category_ids_by_name
+
+
+def _validate_row(row: dict, category_ids: set, category_ids_by_name: Dict[str, int]) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Validate one raw row. Returns (values, None) on success or (None, error message).
+    """
+    row = {key.strip(): (value if value != "" else None) for key, value in row.items() if key}
+    product_id = row.pop("id", None)
+
+    category_name = row.pop("category", None)
+    if row.get("category_id") is None and category_name is not None:
+        row["category_id"] = category_ids_by_name.get(str(category_name).strip().lower())
+        if row["category_id"] is None:
+            return None, f"Unknown category '{category_name}'"
+
+    try:
+        product = schemas.ProductCreateSchema(**{column: row.get(column) for column in PRODUCT_COLUMNS})
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors())
+
+    if product.category_id not in category_ids:
+        return None, "Invalid category_id"
+    if product.price <= 0:
+        return None, "Price must be a positive value"
+    if product.quantity < 0:
+        return None, "Quantity cannot be negative"
+
+    values = product.dict()
+    if product_id is not None:
+        try:
+            values["id"] = int(product_id)
+        except (TypeError, ValueError):
+            return None, "id must be an integer"
+    return values, None
+
+
+def _write_chunk(db: Session, rows: List[dict]) -> Tuple[int, int, set]:
+    """
+    Insert new rows and upsert rows carrying an id, in the caller's transaction, and record them in the change feed.
+    Returns (inserted, updated, affected category ids).
+    """
+    affected_category_ids = {row["category_id"] for row in rows}
+    new_rows = [row for row in rows if "id" not in row]
+    upsert_rows = [row for row in rows if "id" in row]
+
+    updated = 0
+    if upsert_rows:
+        existing = dict(
+            db.query(models.Product.id, models.Product.category_id)
+            .filter(models.Product.id.in_([row["id"] for row in upsert_rows]))
+            .all()
+        )
+        updated = sum(1 for row in upsert_rows if row["id"] in existing)
+        affected_category_ids.update(existing.values()) # Products may move out of their old category
+        upsert = sqlite_insert(models.Product.__table__)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[models.Product.__table__.c.id],
+            set_={column: upsert.excluded[column] for column in PRODUCT_COLUMNS},
+        )
+        db.execute(upsert, upsert_rows)
+        changefeed.record_changes(db, changefeed.PRODUCT, [row["id"] for row in upsert_rows])
+    if new_rows:
+        db.execute(models.Product.__table__.insert(), new_rows)
+        # executemany does not return ids, but inside our write transaction SQLite assigns
+        # implicit rowids as max(id) + 1, so the new rows occupy the top len(new_rows) ids.
+        last_id = db.query(func.max(models.Product.id)).scalar()
+        changefeed.record_changes(db, changefeed.PRODUCT, range(last_id - len(new_rows) + 1, last_id + 1))
+    return len(rows) - updated, updated, affected_category_ids
+
+
+def import_products(db: Session, binary_file, file_format: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Stream-import products, committing once per chunk.
+    Yields one event per rejected row, one progress event per committed chunk and a final summary.
+    """
+    category_ids, category_ids_by_name = _load_category_map(db)
+    totals = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0, "chunks": 0}
+    pending: List[dict] = []
+    pending_row_numbers: List[int] = []
+
+    def flush():
+        try:
+            inserted, updated, affected_category_ids = _write_chunk(db, pending)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            totals["failed"] += len(pending)
+            return {"event": "chunk_failed", "rows": pending_row_numbers[:], "error": str(e)}
+        cache.invalidate_product_listings(*affected_category_ids)
+        typeahead.typeahead_index.invalidate() # Rebuilt on the next suggestion request
+        totals["inserted"] += inserted
+        totals["updated"] += updated
+        return None
+
+    for row_number, row, error in iter_raw_rows(binary_file, file_format):
+        totals["rows"] += 1
+        values = None
+        if error is None:
+            values, error = _validate_row(row, category_ids, category_ids_by_name)
+        if error is not None:
+            totals["failed"] += 1
+            yield {"event": "error", "row": row_number, "error": error}
+        else:
+            pending.append(values)
+            pending_row_numbers.append(row_number)
+
+        if len(pending) >= chunk_size:
+            chunk_error = flush()
+            if chunk_error:
+                yield chunk_error
+            pending.clear()
+            pending_row_numbers.clear()
+            totals["chunks"] += 1
+            yield {"event": "progress", **totals}
+
+    if pending:
+        chunk_error = flush()
+        if chunk_error:
+            yield chunk_error
+        totals["chunks"] += 1
+    yield {"event": "done", **totals}
@@ -0,0 +1,72 @@
+# changefeed.py
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy.orm import Session, joinedload
+
+import models
+import schemas
+
+PRODUCT = "product"
+CATEGORY = "category"
+
+
+def record_changes(db: Session, entity: str, entity_ids: Iterable[int], deleted: bool = False) -> None:
+    """
+    Append change records for the given entities to the current transaction (the caller commits).
+    """
+    changed_at = datetime.utcnow()
+    rows = [
+        {"entity": entity, "entity_id": entity_id, "deleted": deleted, "changed_at": changed_at}
+        for entity_id in dict.fromkeys(entity_ids) # Dedupe, keep order
+    ]
+    if rows:
+        db.execute(models.CatalogChange.__table__.insert(), rows)
+
+
+def read_changes(db: Session, since: int, limit: int) -> schemas.CatalogChangeFeedResponse:
+    """
+    Return the changes recorded after the `since` cursor, oldest first, collapsed to the latest
+    change per entity within the page, with current product/category state batch-loaded.
+    """
+    changes = (
+        db.query(models.CatalogChange)
+        .filter(models.CatalogChange.id > since)
+        .order_by(models.CatalogChange.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_cursor = changes[-1].id if changes else since
+
+    latest = {}
+    for change in changes:
+        latest.pop((change.entity, change.entity_id), None) # Re-insert so dict order follows the latest sequence
+        latest[(change.entity, change.entity_id)] = change
+
+    product_ids = [entity_id for (entity, entity_id), change in latest.items() if entity == PRODUCT and not change.deleted]
+    category_ids = [entity_id for (entity, entity_id), change in latest.items() if entity == CATEGORY and not change.deleted]
+    products = {}
+    if product_ids:
+        products = {
+            product.id: product
+            for product in db.query(models.Product).options(joinedload(models.Product.category)).filter(models.Product.id.in_(product_ids))
+        }
+    categories = {}
+    if category_ids:
+        categories = {category.id: category for category in db.query(models.Category).filter(models.Category.id.in_(category_ids))}
+
+    items = []
+    for (entity, entity_id), change in latest.items():
+        item = schemas.CatalogChangeSchema(seq=change.id, entity=entity, id=entity_id, deleted=change.deleted, changed_at=change.changed_at)
+        if not change.deleted:
+            if entity == PRODUCT and entity_id in products:
+                item.product = schemas.ProductSchema.from_orm(products[entity_id])
+            elif entity == CATEGORY and entity_id in categories:
+                item.category = schemas.CategorySchema.from_orm(categories[entity_id])
+            else:
+                item.deleted = True # Deleted after this page; its tombstone follows in a later page
+        items.append(item)
+
+    return schemas.CatalogChangeFeedResponse(changes=items, next_cursor=next_cursor, has_more=has_more)
@@ -0,0 +1,186 @@
+# idempotency.py
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, Type
+
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import and_, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import models
+import serialization
+from database import SessionLocal
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60 # How long a stored response is replayed
+LOCK_TIMEOUT_SECONDS = 60 # An in-flight claim not extended for this long belongs to a crashed request
+HEARTBEAT_INTERVAL_SECONDS = LOCK_TIMEOUT_SECONDS / 3 # How often a running request extends its claim
+WAIT_TIMEOUT_SECONDS = 30 # How long a concurrent duplicate waits for the first request
+POLL_INTERVAL_SECONDS = 0.05
+SWEEP_INTERVAL_SECONDS = 5 * 60
+SWEEP_BATCH_SIZE = 500
+
+key_table = models.IdempotencyKey.__table__
+
+KEY_INFO = "idempotency_key" # Session.info entry naming the (user_id, key) whose response the transaction stores
+AFTER_COMMIT_INFO = "idempotency_after_commit" # Session.info entry with callbacks for after the commit
+
+
+def request_hash(endpoint: str, payload: Any) -> str:
+    return hashlib.sha256(endpoint.encode("utf-8") + b"\0" + serialization.dumps(jsonable_encoder(payload))).hexdigest()
+
+
+def _claim(db: Session, user_id: int, key: str, fingerprint: str):
+    """
+    Try to become the request that executes `key`. Returns None when claimed, otherwise the stored row.
+    """
+    now = datetime.utcnow()
+    claim = {
+        "request_hash": fingerprint,
+        "response_status": None,
+        "response_body": None,
+        "locked_until": now + timedelta(seconds=LOCK_TIMEOUT_SECONDS),
+        "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    }
+    inserted = db.execute(
+        sqlite_insert(key_table).values(user_id=user_id, key=key, **claim).on_conflict_do_nothing(index_elements=["user_id", "key"])
+    ).rowcount
+    if not inserted: # Take over a claim abandoned by a crashed request, or a stored response past its TTL
+        inserted = db.execute(
+            key_table.update()
+            .where(
+                key_table.c.user_id == user_id,
+                key_table.c.key == key,
+                or_(key_table.c.expires_at <= now, and_(key_table.c.response_status.is_(None), key_table.c.locked_until <= now)),
+            )
+            .values(**claim)
+        ).rowcount
+    db.commit() # Make the claim visible to concurrent duplicates before doing the work
+    if inserted:
+        return None
+    return db.execute(select(key_table).where(key_table.c.user_id == user_id, key_table.c.key == key)).first()
+
+
+def _release(db: Session, user_id: int, key: str) -> None:
+    # The request failed; drop the claim so a retry runs it again
+    db.execute(key_table.delete().where(key_table.c.user_id == user_id, key_table.c.key == key))
+    db.commit()
+
+
+def _keep_claimed(user_id: int, key: str, stop: threading.Event) -> None:
+    """
+    Extend the claim's locked_until while the request runs, so a slow handler is not taken over.
+    """
+    while not stop.wait(HEARTBEAT_INTERVAL_SECONDS):
+        db = SessionLocal()
+        try:
+            db.execute(
+                key_table.update()
+                .where(key_table.c.user_id == user_id, key_table.c.key == key, key_table.c.response_status.is_(None))
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=LOCK_TIMEOUT_SECONDS))
+            )
+            db.commit()
+        except OperationalError:
+            db.rollback() # The handler's transaction holds the write lock, which keeps duplicates out meanwhile
+        finally:
+            db.close()
+
+
+def after_commit(db: Session, callback: Callable[[], None]) -> None:
+    """
+    Run `callback` once the transaction of the current run() has committed (cache invalidation,
+    in-process indexes). Dropped if the transaction rolls back.
+    """
+    db.info.setdefault(AFTER_COMMIT_INFO, []).append(callback)
+
+
+def run(
+    db: Session,
+    user_id: int,
+    key: Optional[str],
+    endpoint: str,
+    payload: Any,
+    response_model: Type[BaseModel],
+    status_code: int,
+    handler: Callable[[], Any],
+):
+    """
+    Execute `handler` at most once per (user, Idempotency-Key). The first successful response is
+    stored and replayed byte for byte to retries; a retry that arrives while the first request is
+    still running waits for it. Failed requests (any exception, including HTTPException) are not
+    stored, so they can be retried. Without a key, `handler` runs and commits the same way, without
+    the at-most-once bookkeeping.
+
+    `handler` only flushes its writes: run() serializes the result, stores the response row and
+    commits both in one transaction, so a crash can never keep the work without its response (a
+    retry would repeat it) or the response without the work. Side effects outside the database
+    are registered with after_commit().
+    """
+    stop_heartbeat = None
+    if key is not None:
+        fingerprint = request_hash(endpoint, payload)
+        deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+        while True:
+            stored = _claim(db, user_id, key, fingerprint)
+            if stored is None:
+                break
+            if stored.request_hash != fingerprint:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+            if stored.response_status is not None:
+                response = serialization.json_response(body=stored.response_body, status_code=stored.response_status)
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress")
+            time.sleep(POLL_INTERVAL_SECONDS)
+        stop_heartbeat = threading.Event()
+        threading.Thread(target=_keep_claimed, args=(user_id, key, stop_heartbeat), daemon=True).start()
+        db.info[KEY_INFO] = (user_id, key)
+
+    try:
+        result = handler()
+        if isinstance(result, Response):
+            body = result.body
+        else:
+            body = serialization.dumps(jsonable_encoder(result if isinstance(result, BaseModel) else response_model.from_orm(result)))
+        if key is not None:
+            db.execute(
+                key_table.update()
+                .where(key_table.c.user_id == user_id, key_table.c.key == key)
+                .values(response_status=status_code, response_body=body)
+            )
+        db.commit()
+    except BaseException:
+        db.rollback()
+        db.info.pop(AFTER_COMMIT_INFO, None)
+        if key is not None:
+            stop_heartbeat.set()
+            db.info.pop(KEY_INFO, None)
+            _release(db, user_id, key)
+        raise
+    if key is not None:
+        stop_heartbeat.set()
+        db.info.pop(KEY_INFO, None)
+    for callback in db.info.pop(AFTER_COMMIT_INFO, ()):
+        callback()
+    return serialization.json_response(body=body, status_code=status_code)
+
+
+def sweep_expired(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """
+    Delete expired keys in small batches. Expired keys are already ignored when claiming.
+    """
+    removed = 0
+    while True:
+        expired_ids = select(key_table.c.id).where(key_table.c.expires_at <= datetime.utcnow()).limit(batch_size)
+        deleted = db.execute(key_table.delete().where(key_table.c.id.in_(expired_ids))).rowcount
+        db.commit()
+        removed += deleted
+        if deleted < batch_size:
+            return removed
@@ -1,18 +1,44 @@
 # main.py
 from typing import List
 from fastapi import FastAPI, Depends, HTTPException, Query
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
 from database import get_db, engine, SessionLocal
 import models
 import schemas
 import auth
+import reservations
+import idempotency
+import cart_store
+import tasks
+import outbox
+import rankings
+import recommendations
+import archive
+import sales_rollups
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.status import HTTP_422_UNPROCESSABLE_ENTITY
-from routers import categories, products, users, orders # Import routers
+from routers import categories, products, users, orders, analytics # Import routers
 from auth import router as auth_router # Import auth router
 
 models.Base.metadata.create_all(bind=engine)
+# create_all() only creates indexes along with new tables; add indexes declared later on existing tables
+for table in models.Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+# Nor does it add columns declared later; those are all nullable, so ALTER TABLE ... ADD COLUMN is enough
+added_columns = set()
+with engine.begin() as connection:
+    inspector = inspect(connection)
+    for table in models.Base.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"))
+                added_columns.add(f"{table.name}.{column.name}")
+with SessionLocal() as db:
+    sales_rollups.upgrade(db, added_columns)
 
 app = FastAPI()
 
@@ -21,6 +47,7 @@ app.include_router(categories.router)
 app.include_router(products.router)
 app.include_router(users.router)
 app.include_router(orders.router)
+app.include_router(analytics.router)
 app.include_router(auth_router)
 
 
@@ -38,7 +65,24 @@ def initialize_roles(db: Session):
 async def startup_event():
     db = SessionLocal() # Use SessionLocal directly here
     initialize_roles(db)
+    rankings.product_rankings.ensure_loaded(db) # Load before the first checkout can add to the rollups
     db.close()
+    tasks.start_periodic(reservations.SWEEP_INTERVAL_SECONDS, reservations.sweep_expired) # Release expired cart holds
+    tasks.start_periodic(idempotency.SWEEP_INTERVAL_SECONDS, idempotency.sweep_expired) # Drop expired idempotency keys
+    if cart_store.CART_STORE_BACKEND == "memory":
+        tasks.start_periodic(cart_store.WRITE_BACK_INTERVAL_SECONDS, cart_store.store.write_back) # Copy buffered carts to order_items
+    tasks.start_periodic(rankings.PERSIST_INTERVAL_SECONDS, rankings.product_rankings.persist) # Save best-seller counters
+    tasks.start_periodic(recommendations.REBUILD_INTERVAL_SECONDS, recommendations.rebuild_job) # Refresh "customers also bought"
+    tasks.start_periodic(archive.ARCHIVE_INTERVAL_SECONDS, archive.archive_orders) # Move old final orders to the archive tables
+    if outbox.WEBHOOK_ENDPOINTS:
+        tasks.start(outbox.run_dispatcher()) # Deliver queued order events; undelivered ones survive a restart
+        tasks.start_periodic(outbox.SWEEP_INTERVAL_SECONDS, outbox.sweep_delivered)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await tasks.stop_all()
+    await tasks.run_once(cart_store.store.write_back) # Final flush; the journal covers a crash before this
+    await tasks.run_once(rankings.product_rankings.persist)
 
 
 # --- Error Handling ---
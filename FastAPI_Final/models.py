@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Table, Enum
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Table, Enum, Index, UniqueConstraint, LargeBinary, text, Date
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -13,6 +13,15 @@ class OrderStatus(str, enum.Enum): # Use enum.Enum
     DELIVERED = "delivered"
     CANCELLED = "cancelled"
 
+# Allowed status changes; delivered and cancelled orders are final
+ORDER_STATUS_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.PROCESSING, OrderStatus.SHIPPED, OrderStatus.CANCELLED},
+    OrderStatus.PROCESSING: {OrderStatus.SHIPPED, OrderStatus.CANCELLED},
+    OrderStatus.SHIPPED: {OrderStatus.DELIVERED},
+    OrderStatus.DELIVERED: set(),
+    OrderStatus.CANCELLED: set(),
+}
+
 # Association table for User and Role (Many-to-Many)
 user_role_association = Table(
     "user_role",
@@ -51,6 +60,17 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # One index per listing sort order, led by the category filter, so sorted pages
+        # (including keyset/cursor pages) are read in index order instead of sorted in a temp B-tree.
+        Index("ix_products_category_price", "category_id", "price", "id"),
+        Index("ix_products_category_name", "category_id", "name", "id"),
+        Index("ix_products_category_quantity", "category_id", "quantity", "id"),
+        Index("ix_products_category_newest", "category_id", "id"),
+        # Same orders without a category filter (ix_products_name already covers name)
+        Index("ix_products_price", "price", "id"),
+        Index("ix_products_quantity", "quantity", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
@@ -67,6 +87,11 @@ class Product(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_user", "user_id", "id"), # Per-customer order lists in id order
+        Index("ix_orders_status_date", "status", "order_date"), # Archival candidates
+        {"sqlite_autoincrement": True}, # Ids are never reused, so they can't collide with archived orders
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -78,6 +103,9 @@ class Order(Base):
 
 class OrderItem(Base): # OrderItem now represents CART ITEM
     __tablename__ = "order_items" # Keep table name as order_items for cart
+    __table_args__ = (
+        Index("ix_order_items_user_product", "user_id", "product_id", "quantity", "price"), # Covers cart lookups and the cart summary
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False) # Keep user_id for cart association
@@ -91,10 +119,15 @@ class OrderItem(Base): # OrderItem now represents CART ITEM
 
 class OrderLineItem(Base): # New model for ORDER LINE ITEMS
     __tablename__ = "order_line_items" # New table for order line items
+    __table_args__ = (
+        Index("ix_order_line_items_order", "order_id", "quantity", "price"), # Covers per-order totals
+        {"sqlite_autoincrement": True}, # Same for archived line ids
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False) # Foreign Key to Order (NOT NULL)
     product_id = Column(Integer, ForeignKey("products.id")) # Foreign Key to Product
+    category_id = Column(Integer, nullable=True) # Product category at the time of order; no foreign key, history outlives categories
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False) # Price at the time of order
 
@@ -102,6 +135,21 @@ class OrderLineItem(Base): # New model for ORDER LINE ITEMS
     product = relationship("Product", back_populates="order_line_items") # Relationship with Product
 
 
+class StockReservation(Base): # Stock held for a user's cart item until checkout or expiry
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_stock_reservations_user_product"), # One hold per cart line
+        Index("ix_stock_reservations_product_expiry", "product_id", "expires_at", "quantity"), # Covers live-hold sums per product
+        Index("ix_stock_reservations_expires_at", "expires_at"), # Sweeper
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
 class FavoriteProduct(Base):
     __tablename__ = "favorite_products"
 
@@ -110,4 +158,148 @@ class FavoriteProduct(Base):
     product_id = Column(Integer, ForeignKey("products.id"))
 
     user = relationship("User", back_populates="favorite_products") # Corrected back_populates to "favorite_products"
-    product = relationship("Product", back_populates="favorite_products") # Corrected back_populates to "favorite_products"
\ No newline at end of file
+    product = relationship("Product", back_populates="favorite_products") # Corrected back_populates to "favorite_products"
+
+
+class CatalogChange(Base): # Append-only log of catalog changes, read by incremental syncs
+    __tablename__ = "catalog_changes"
+    __table_args__ = {"sqlite_autoincrement": True} # Sequence numbers are never reused, so they work as cursors
+
+    id = Column(Integer, primary_key=True) # Monotonic change sequence
+    entity = Column(String, nullable=False) # "product" or "category"
+    entity_id = Column(Integer, nullable=False)
+    deleted = Column(Boolean, default=False, nullable=False) # Tombstone for deletes
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class IdempotencyKey(Base): # Stored first response of a request sent with an Idempotency-Key header
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"), # Keys are scoped per user
+        Index("ix_idempotency_keys_expires_at", "expires_at"), # TTL cleanup
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False) # sha256 of endpoint + body, detects key reuse
+    response_status = Column(Integer, nullable=True) # NULL while the first request is in flight
+    response_body = Column(LargeBinary, nullable=True) # Compact JSON bytes, replayed verbatim
+    locked_until = Column(DateTime, nullable=False) # An in-flight claim older than this is taken over
+    expires_at = Column(DateTime, nullable=False)
+
+
+class OutboxEvent(Base): # Order event waiting to be delivered to one webhook endpoint; written with the order change
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("ix_outbox_events_due", "next_attempt_at", "id", sqlite_where=text("delivered_at IS NULL")), # Dispatcher scan
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(String(32), nullable=False) # Same for every endpoint copy of an event
+    event_type = Column(String, nullable=False) # "order.created" or "order.status_changed"
+    order_id = Column(Integer, nullable=False) # No foreign key: events outlive deleted orders
+    endpoint = Column(String, nullable=False)
+    payload = Column(LargeBinary, nullable=False) # JSON event envelope, sent verbatim
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=True) # NULL once retries are exhausted (parked)
+    delivered_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+
+
+# --- Sales rollups: maintained with every order change, rebuilt by sales_rollups.py ---
+class SalesDaily(Base): # Revenue per day
+    __tablename__ = "sales_daily"
+    __table_args__ = {"sqlite_with_rowid": False} # Rows clustered by day for range scans
+
+    day = Column(Date, primary_key=True) # UTC order date
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+    orders = Column(Integer, default=0, nullable=False)
+
+
+class SalesDailyCategory(Base): # Revenue per day and category (products without a category are left out)
+    __tablename__ = "sales_daily_categories"
+    __table_args__ = (
+        Index("ix_sales_daily_categories_category", "category_id", "day"), # One category over a date range
+        {"sqlite_with_rowid": False}, # Rows clustered by (day, ...) for range scans
+    )
+
+    day = Column(Date, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+    orders = Column(Integer, default=0, nullable=False) # Orders with at least one line in the category
+
+
+class SalesDailyProduct(Base): # Revenue per day, product and the product's category at the time of sale
+    __tablename__ = "sales_daily_products"
+    __table_args__ = (
+        Index("ix_sales_daily_products_product", "product_id", "day"), # One product over a date range
+        Index("ix_sales_daily_products_category", "category_id", "day"), # Products of one category
+        {"sqlite_with_rowid": False}, # Rows clustered by (day, ...) for range scans
+    )
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, primary_key=True) # sales_rollups.NO_CATEGORY for products without one
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+    orders = Column(Integer, default=0, nullable=False)
+
+
+class ProductSalesScore(Base): # Decayed units sold per ranking, written back periodically by rankings.py
+    __tablename__ = "product_sales_scores"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(String, primary_key=True) # "best_sellers" or "trending"
+    score = Column(Float, nullable=False) # Decayed units sold as of scored_at
+    scored_at = Column(DateTime, nullable=False)
+
+
+class ProductNeighbor(Base): # "Customers also bought": top co-purchased products, rebuilt by recommendations.py
+    __tablename__ = "product_neighbors"
+    __table_args__ = {"sqlite_with_rowid": False} # Clustered by (product_id, rank): one range read per product
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, primary_key=True) # 1 = strongest
+    neighbor_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False) # Cosine similarity or lift of the pair
+    orders = Column(Integer, nullable=False) # Orders containing both products
+
+
+# --- Order archive: final orders past archive.ARCHIVE_AFTER_DAYS, moved out of the hot tables ---
+class ArchivedOrder(Base): # Same columns and relationships as Order, so the same serializers apply
+    __tablename__ = "archived_orders"
+    __table_args__ = (
+        Index("ix_archived_orders_user", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True) # Id the order had in orders
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL")) # Archive rows outlive users and products
+    order_date = Column(DateTime)
+    status = Column(Enum(OrderStatus))
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    user = relationship("User")
+    order_line_items = relationship("ArchivedOrderLineItem", back_populates="order", cascade="all, delete-orphan")
+
+
+class ArchivedOrderLineItem(Base):
+    __tablename__ = "archived_order_line_items"
+    __table_args__ = (
+        Index("ix_archived_order_line_items_order", "order_id"),
+    )
+
+    id = Column(Integer, primary_key=True) # Id the line had in order_line_items
+    order_id = Column(Integer, ForeignKey("archived_orders.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"))
+    category_id = Column(Integer, nullable=True)
+    quantity = Column(Integer, nullable=False)
+    price = Column(Float, nullable=False)
+
+    order = relationship("ArchivedOrder", back_populates="order_line_items")
+    product = relationship("Product")
\ No newline at end of file
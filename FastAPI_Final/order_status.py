@@ -0,0 +1,121 @@
+# order_status.py
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import Session
+
+import models
+import changefeed
+import outbox
+import sales_rollups
+
+UPDATED = "updated"
+UNCHANGED = "unchanged" # Already in the requested status
+NOT_FOUND = "not_found"
+INVALID_TRANSITION = "invalid_transition"
+
+STATUS_CHUNK_SIZE = 500 # Order ids per IN (...) list
+MAX_ATTEMPTS = 3 # Re-reads after a concurrent status change before giving up
+
+order_table = models.Order.__table__
+line_item_table = models.OrderLineItem.__table__
+product_table = models.Product.__table__
+
+
+class ConcurrentStatusChange(Exception):
+    pass
+
+
+def _chunks(ids: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(ids), STATUS_CHUNK_SIZE):
+        yield ids[start:start + STATUS_CHUNK_SIZE]
+
+
+def transition_orders(db: Session, order_ids: List[int], target: models.OrderStatus) -> Tuple[List[dict], Set[int], list]:
+    """
+    Move orders to `target` where models.ORDER_STATUS_TRANSITIONS allows it, with one UPDATE per
+    source status (and id chunk). Each UPDATE is conditioned on the status that was read, so an
+    order changed concurrently makes the row count come up short; the transaction is then rolled
+    back and re-read. Orders moved to CANCELLED have their line item quantities put back in stock.
+    An order.status_changed outbox event is queued for every updated order, and cancelled orders
+    are taken out of the sales rollups.
+
+    Returns per-order results in request order ({"id", "result", "status"}), the ids of the
+    restocked products and the line items taken out of the rollups (see sales_rollups.remove_orders).
+    Must be called without other pending changes; the caller commits.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    for _ in range(MAX_ATTEMPTS):
+        current, owners = {}, {}
+        for chunk in _chunks(order_ids):
+            for order_id, order_status, user_id in db.execute(
+                select(order_table.c.id, order_table.c.status, order_table.c.user_id).where(order_table.c.id.in_(chunk))
+            ):
+                current[order_id] = order_status
+                owners[order_id] = user_id
+
+        results: Dict[int, dict] = {}
+        by_source: Dict[models.OrderStatus, List[int]] = {}
+        for order_id in order_ids:
+            if order_id not in current:
+                results[order_id] = {"id": order_id, "result": NOT_FOUND, "status": None}
+                continue
+            source = current[order_id]
+            if source == target:
+                results[order_id] = {"id": order_id, "result": UNCHANGED, "status": source.value}
+            elif target not in models.ORDER_STATUS_TRANSITIONS.get(source, ()):
+                results[order_id] = {"id": order_id, "result": INVALID_TRANSITION, "status": source.value if source is not None else None}
+            else:
+                by_source.setdefault(source, []).append(order_id)
+                results[order_id] = {"id": order_id, "result": UPDATED, "status": target.value}
+
+        try:
+            for source, source_ids in by_source.items():
+                for chunk in _chunks(source_ids):
+                    updated = db.execute(
+                        order_table.update()
+                        .where(order_table.c.id.in_(chunk), order_table.c.status == source)
+                        .values(status=target)
+                    ).rowcount
+                    if updated != len(chunk):
+                        raise ConcurrentStatusChange()
+        except ConcurrentStatusChange:
+            db.rollback()
+            continue
+
+        outbox.record_events(db, outbox.ORDER_STATUS_CHANGED, [
+            {"order_id": order_id, "user_id": owners[order_id], "previous_status": source.value, "status": target.value}
+            for source, source_ids in by_source.items()
+            for order_id in source_ids
+        ])
+        restocked_product_ids, cancelled_lines = set(), []
+        if target == models.OrderStatus.CANCELLED:
+            cancelled_ids = [order_id for source_ids in by_source.values() for order_id in source_ids]
+            restocked_product_ids = restock_orders(db, cancelled_ids)
+            cancelled_lines = sales_rollups.remove_orders(db, cancelled_ids)
+        return [results[order_id] for order_id in order_ids], restocked_product_ids, cancelled_lines
+    raise ConcurrentStatusChange()
+
+
+def restock_orders(db: Session, order_ids: List[int]) -> Set[int]:
+    """
+    Add the line item quantities of the given orders back to product stock: one grouped SELECT per
+    id chunk and one executemany UPDATE. Returns the restocked product ids. The caller commits.
+    """
+    quantities: Dict[int, int] = {}
+    for chunk in _chunks(order_ids):
+        for product_id, quantity in db.execute(
+            select(line_item_table.c.product_id, func.sum(line_item_table.c.quantity))
+            .where(line_item_table.c.order_id.in_(chunk), line_item_table.c.product_id.isnot(None))
+            .group_by(line_item_table.c.product_id)
+        ):
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if quantities:
+        db.execute(
+            product_table.update()
+            .where(product_table.c.id == bindparam("b_product_id"))
+            .values(quantity=func.coalesce(product_table.c.quantity, 0) + bindparam("b_quantity")),
+            [{"b_product_id": product_id, "b_quantity": quantity} for product_id, quantity in quantities.items()],
+        )
+        changefeed.record_changes(db, changefeed.PRODUCT, quantities) # Stock changed
+    return set(quantities)
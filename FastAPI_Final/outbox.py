@@ -0,0 +1,180 @@
+# outbox.py
+import asyncio
+import random
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session
+
+import models
+import serialization
+from database import SessionLocal
+
+# Webhook URLs that receive every order event, e.g. ["http://warehouse.local/hooks/orders"].
+# Each endpoint gets its own copy of an event and its own retry schedule.
+WEBHOOK_ENDPOINTS: List[str] = []
+WEBHOOK_TIMEOUT_SECONDS = 10
+DISPATCH_INTERVAL_SECONDS = 1 # Poll interval while the outbox is drained
+DISPATCH_BATCH_SIZE = 200 # Events fetched per round; one POST per endpoint per round
+MAX_DELIVERY_ATTEMPTS = 12 # After this many failures an event is parked (next_attempt_at NULL)
+BACKOFF_BASE_SECONDS = 2 # Retry delay doubles per failed attempt, with jitter
+BACKOFF_MAX_SECONDS = 30 * 60
+DELIVERED_RETENTION_SECONDS = 7 * 24 * 60 * 60 # Delivered events are kept this long for inspection
+SWEEP_INTERVAL_SECONDS = 60 * 60
+SWEEP_BATCH_SIZE = 500
+
+ORDER_CREATED = "order.created"
+ORDER_STATUS_CHANGED = "order.status_changed"
+
+outbox_table = models.OutboxEvent.__table__
+
+
+def record_events(db: Session, event_type: str, events: List[dict]) -> None:
+    """
+    Queue events for every configured webhook in the caller's transaction, so an event exists if
+    and only if the order change it describes was committed. Each event dict needs an "order_id";
+    it is sent as the event's "data". The caller commits.
+    """
+    if not events or not WEBHOOK_ENDPOINTS:
+        return
+    now = datetime.utcnow()
+    rows = []
+    for data in events:
+        event_id = uuid.uuid4().hex # Shared by all endpoint copies; receivers deduplicate on it
+        payload = serialization.dumps({"id": event_id, "type": event_type, "occurred_at": now, "data": data})
+        for endpoint in WEBHOOK_ENDPOINTS:
+            rows.append({
+                "event_id": event_id,
+                "event_type": event_type,
+                "order_id": data["order_id"],
+                "endpoint": endpoint,
+                "payload": payload,
+                "created_at": now,
+                "attempts": 0,
+                "next_attempt_at": now,
+            })
+    db.execute(outbox_table.insert(), rows)
+
+
+def _due_events(db: Session, limit: int) -> list:
+    # Served from the partial index over undelivered events
+    return db.execute(
+        select(outbox_table.c.id, outbox_table.c.endpoint, outbox_table.c.attempts, outbox_table.c.payload)
+        .where(outbox_table.c.delivered_at.is_(None), outbox_table.c.next_attempt_at <= datetime.utcnow())
+        .order_by(outbox_table.c.next_attempt_at, outbox_table.c.id)
+        .limit(limit)
+    ).all()
+
+
+def retry_delay(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0) # Jitter spreads retries after an outage
+
+
+def _record_results(db: Session, delivered_ids: List[int], failures: List[dict]) -> None:
+    now = datetime.utcnow()
+    if delivered_ids:
+        db.execute(outbox_table.update().where(outbox_table.c.id.in_(delivered_ids)).values(delivered_at=now))
+    if failures:
+        db.execute(
+            outbox_table.update()
+            .where(outbox_table.c.id == bindparam("b_id"))
+            .values(attempts=bindparam("b_attempts"), next_attempt_at=bindparam("b_next_attempt_at"), last_error=bindparam("b_error")),
+            [
+                {
+                    "b_id": failure["id"],
+                    "b_attempts": failure["attempts"],
+                    "b_next_attempt_at": now + timedelta(seconds=retry_delay(failure["attempts"])) if failure["attempts"] < MAX_DELIVERY_ATTEMPTS else None,
+                    "b_error": failure["error"][:500],
+                }
+                for failure in failures
+            ],
+        )
+    db.commit()
+
+
+def _in_session(job, *args):
+    db = SessionLocal()
+    try:
+        return job(db, *args)
+    finally:
+        db.close()
+
+
+async def _post_batch(client: httpx.AsyncClient, endpoint: str, payloads: List[bytes]) -> Optional[str]:
+    """
+    POST {"events": [...]} to one endpoint. Returns None on a 2xx response, otherwise the error.
+    """
+    body = b'{"events":[' + b",".join(payloads) + b"]}" # Stored payloads are already JSON
+    try:
+        response = await client.post(endpoint, content=body, headers={"Content-Type": "application/json"})
+    except httpx.HTTPError as e:
+        return f"{type(e).__name__}: {e}"
+    if response.is_success:
+        return None
+    return f"HTTP {response.status_code}: {response.text[:200]}"
+
+
+async def dispatch_once(client: httpx.AsyncClient, batch_size: int = DISPATCH_BATCH_SIZE) -> int:
+    """
+    Deliver one batch of due events: one POST per endpoint, sent concurrently. Events are marked
+    delivered only after a 2xx response, so a crash in between redelivers them (at-least-once);
+    a failed POST reschedules its events with exponential backoff. Returns the number of events fetched.
+    """
+    loop = asyncio.get_running_loop()
+    due = await loop.run_in_executor(None, _in_session, _due_events, batch_size)
+    if not due:
+        return 0
+
+    by_endpoint: Dict[str, list] = {}
+    for row in due:
+        by_endpoint.setdefault(row.endpoint, []).append(row)
+    endpoints = list(by_endpoint)
+    errors = await asyncio.gather(*(
+        _post_batch(client, endpoint, [row.payload for row in by_endpoint[endpoint]]) for endpoint in endpoints
+    ))
+
+    delivered_ids, failures = [], []
+    for endpoint, error in zip(endpoints, errors):
+        for row in by_endpoint[endpoint]:
+            if error is None:
+                delivered_ids.append(row.id)
+            else:
+                failures.append({"id": row.id, "attempts": row.attempts + 1, "error": error})
+    await loop.run_in_executor(None, _in_session, _record_results, delivered_ids, failures)
+    return len(due)
+
+
+async def run_dispatcher() -> None:
+    """
+    Background loop: drain due events batch by batch, then poll every DISPATCH_INTERVAL_SECONDS.
+    Errors are logged and the loop keeps going.
+    """
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT_SECONDS) as client:
+        while True:
+            try:
+                fetched = await dispatch_once(client)
+            except Exception:
+                print(f"Outbox dispatch failed:\n{traceback.format_exc()}") # Log details for debugging
+                fetched = 0
+            if fetched < DISPATCH_BATCH_SIZE:
+                await asyncio.sleep(DISPATCH_INTERVAL_SECONDS)
+
+
+def sweep_delivered(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """
+    Delete delivered events past their retention in small batches. Parked events are kept.
+    """
+    removed = 0
+    while True:
+        cutoff = datetime.utcnow() - timedelta(seconds=DELIVERED_RETENTION_SECONDS)
+        old_ids = select(outbox_table.c.id).where(outbox_table.c.delivered_at <= cutoff).limit(batch_size)
+        deleted = db.execute(outbox_table.delete().where(outbox_table.c.id.in_(old_ids))).rowcount
+        db.commit()
+        removed += deleted
+        if deleted < batch_size:
+            return removed
@@ -0,0 +1,266 @@
+# rankings.py
+import heapq
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+
+# Ranking kind -> half-life of a sale's weight
+RANKING_HALF_LIVES = {
+    "best_sellers": timedelta(days=30),
+    "trending": timedelta(days=2),
+}
+MAX_TOP_K = 50 # Longest list served per ranking and category
+PERSIST_INTERVAL_SECONDS = 60
+_REBASE_EXPONENT = 512 # Shift the landmark before 2**exponent gets near the float limit
+
+score_table = models.ProductSalesScore.__table__
+product_table = models.Product.__table__
+rollup_table = models.SalesDailyProduct.__table__
+
+
+class _Ranking:
+    """
+    Forward-decayed sales counters for one half-life. A sale of `units` at time t adds
+    units * 2**((t - landmark) / half_life), so older sales never need to be touched: every stored
+    value decays by the same factor and the order between products only changes when one of them sells.
+    The top MAX_TOP_K list of each category is maintained exactly on every sale; a cancelled sale
+    subtracts the weight of its original time and drops the top lists the product was in.
+    """
+
+    def __init__(self, half_life: timedelta, landmark: datetime):
+        self.half_life = half_life.total_seconds()
+        self.landmark = landmark
+        self.values: Dict[int, float] = {}
+        self.tops: Dict[Optional[int], List[int]] = {} # category_id (None = all products) -> top ids, best first
+
+    def _value(self, product_id: int) -> float:
+        return self.values.get(product_id, 0.0)
+
+    def _exponent(self, at: datetime) -> float:
+        return (at - self.landmark).total_seconds() / self.half_life
+
+    def weight(self, at: datetime) -> float:
+        exponent = self._exponent(at)
+        if exponent > _REBASE_EXPONENT:
+            self.rebase(at)
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def rebase(self, at: datetime) -> None:
+        factor = 2.0 ** -self._exponent(at)
+        self.values = {product_id: value * factor for product_id, value in self.values.items()}
+        self.landmark = at
+
+    def score(self, product_id: int, at: datetime) -> float:
+        # Decayed units sold as of `at`
+        return self.values.get(product_id, 0.0) * 2.0 ** -self._exponent(at)
+
+    def add(self, product_id: int, value: float, buckets: Tuple[Optional[int], ...]) -> None:
+        self.values[product_id] = self.values.get(product_id, 0.0) + value
+        for bucket in buckets:
+            top = self.tops.get(bucket)
+            if top is None: # Built on first read
+                continue
+            if product_id in top:
+                top.sort(key=self._value, reverse=True)
+            elif len(top) < MAX_TOP_K or self._value(product_id) > self._value(top[-1]):
+                top.append(product_id)
+                top.sort(key=self._value, reverse=True)
+                del top[MAX_TOP_K:]
+
+    def subtract(self, product_id: int, value: float, buckets: Tuple[Optional[int], ...]) -> None:
+        if product_id not in self.values:
+            return
+        self.values[product_id] = max(self.values[product_id] - value, 0.0) # Rounding, or a sale bootstrapped at midday
+        for bucket in buckets:
+            if product_id in self.tops.get(bucket, ()):
+                del self.tops[bucket] # A runner-up may move in; rebuilt on the next read
+
+    def top(self, bucket: Optional[int], members: Set[int]) -> List[int]:
+        top = self.tops.get(bucket)
+        if top is None:
+            top = heapq.nlargest(MAX_TOP_K, members, key=self._value)
+            self.tops[bucket] = top
+        return top
+
+
+class ProductRankings:
+    """
+    In-memory best-seller and trending rankings, overall and per category. Loaded lazily from
+    product_sales_scores (or bootstrapped from the sales rollups), updated on checkout and written
+    back by a periodic job.
+    """
+
+    def __init__(self):
+        self.rankings: Dict[str, _Ranking] = {}
+        self.categories: Dict[int, Optional[int]] = {} # product_id -> category_id
+        self.members: Dict[Optional[int], Set[int]] = {None: set()}
+        self.dirty: Set[int] = set()
+        self.loaded = False
+        self._lock = threading.RLock()
+
+    def ensure_loaded(self, db: Session) -> None:
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            now = datetime.utcnow()
+            self.rankings = {kind: _Ranking(half_life, now) for kind, half_life in RANKING_HALF_LIVES.items()}
+            self.categories, self.members, self.dirty = {}, {None: set()}, set()
+            rows = db.execute(
+                select(score_table.c.kind, score_table.c.product_id, product_table.c.category_id, score_table.c.score, score_table.c.scored_at)
+                .select_from(score_table.join(product_table, product_table.c.id == score_table.c.product_id))
+            ).all()
+            if rows:
+                for kind, product_id, category_id, score, scored_at in rows:
+                    ranking = self.rankings.get(kind)
+                    if ranking is not None:
+                        self._place(product_id, category_id)
+                        ranking.values[product_id] = score * ranking.weight(scored_at)
+            else: # First start: derive the counters from the daily product rollups
+                for product_id, category_id, day, units in db.execute(
+                    select(rollup_table.c.product_id, product_table.c.category_id, rollup_table.c.day, rollup_table.c.units)
+                    .select_from(rollup_table.join(product_table, product_table.c.id == rollup_table.c.product_id))
+                    .where(rollup_table.c.units > 0)
+                ):
+                    self._place(product_id, category_id)
+                    sold_at = min(datetime.combine(day, datetime.min.time()) + timedelta(hours=12), now) # Midday, but never in the future
+                    for ranking in self.rankings.values():
+                        ranking.values[product_id] = ranking.values.get(product_id, 0.0) + units * ranking.weight(sold_at)
+                    self.dirty.add(product_id)
+            self.loaded = True
+
+    def _place(self, product_id: int, category_id: Optional[int]) -> None:
+        # Track the product's category; callers hold the lock
+        if product_id in self.categories and self.categories[product_id] == category_id:
+            return
+        self._unplace(product_id)
+        self.categories[product_id] = category_id
+        self.members[None].add(product_id)
+        buckets = (None,)
+        if category_id is not None:
+            self.members.setdefault(category_id, set()).add(product_id)
+            buckets = (None, category_id)
+        for ranking in self.rankings.values():
+            if product_id in ranking.values:
+                ranking.add(product_id, 0.0, buckets) # Enter the new category's top list if it qualifies
+
+    def _unplace(self, product_id: int) -> None:
+        if product_id not in self.categories:
+            return
+        category_id = self.categories.pop(product_id)
+        self.members[None].discard(product_id)
+        buckets = [None]
+        if category_id is not None:
+            self.members.get(category_id, set()).discard(product_id)
+            buckets.append(category_id)
+        for ranking in self.rankings.values():
+            for bucket in buckets:
+                if product_id in ranking.tops.get(bucket, ()):
+                    del ranking.tops[bucket] # A runner-up may move in; rebuilt on the next read
+
+    def record_sales(self, quantities: Dict[int, int], categories: Dict[int, Optional[int]]) -> None:
+        """
+        Count units sold (product_id -> quantity) now; `categories` maps each product to its category.
+        Call ensure_loaded before committing the sale: loading afterwards would bootstrap from
+        rollups that already contain it, counting it twice.
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            if not self.loaded:
+                return
+            for product_id, quantity in quantities.items():
+                category_id = categories.get(product_id)
+                self._place(product_id, category_id)
+                buckets = (None,) if category_id is None else (None, category_id)
+                for ranking in self.rankings.values():
+                    ranking.add(product_id, quantity * ranking.weight(now), buckets)
+                self.dirty.add(product_id)
+
+    def remove_sales(self, lines: List[tuple]) -> None:
+        """
+        Take cancelled or deleted order lines, as returned by sales_rollups.remove_orders, back out
+        of the counters at the weight of their order date. Like record_sales, call ensure_loaded
+        before committing: the rollups a later load bootstraps from no longer contain them.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            for _, order_date, product_id, _, quantity, _ in lines:
+                if product_id is None or product_id not in self.categories:
+                    continue
+                category_id = self.categories[product_id]
+                buckets = (None,) if category_id is None else (None, category_id)
+                for ranking in self.rankings.values():
+                    ranking.subtract(product_id, quantity * ranking.weight(order_date), buckets)
+                self.dirty.add(product_id)
+
+    def top(self, db: Session, kind: str, category_id: Optional[int], limit: int) -> List[Tuple[int, float]]:
+        """
+        Up to `limit` (product_id, score) pairs, best first; scores are decayed units sold.
+        """
+        self.ensure_loaded(db)
+        now = datetime.utcnow()
+        with self._lock:
+            ranking = self.rankings[kind]
+            members = self.members.get(category_id, set())
+            return [(product_id, ranking.score(product_id, now)) for product_id in ranking.top(category_id, members)[:limit]]
+
+    # --- Catalog changes (no-ops until loaded) ---
+    def product_moved(self, product_id: int, category_id: Optional[int]) -> None:
+        with self._lock:
+            if self.loaded and product_id in self.categories:
+                self._place(product_id, category_id)
+
+    def product_deleted(self, product_id: int) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            self._unplace(product_id)
+            for ranking in self.rankings.values():
+                ranking.values.pop(product_id, None)
+            self.dirty.discard(product_id)
+
+    def persist(self, db: Session) -> int:
+        """
+        Write the current scores of products sold since the last run. Products deleted in the
+        meantime are skipped. Returns the number of products written.
+        """
+        with self._lock:
+            if not self.loaded or not self.dirty:
+                return 0
+            now = datetime.utcnow()
+            dirty, self.dirty = self.dirty, set()
+            rows = [
+                {"b_product_id": product_id, "b_kind": kind, "b_score": ranking.score(product_id, now)}
+                for product_id in dirty
+                for kind, ranking in self.rankings.items()
+                if product_id in ranking.values
+            ]
+        scores = select(
+            bindparam("b_product_id"), bindparam("b_kind"), bindparam("b_score"), literal(now)
+        ).where(select(product_table.c.id).where(product_table.c.id == bindparam("b_product_id")).exists())
+        statement = sqlite_insert(score_table).from_select(["product_id", "kind", "score", "scored_at"], scores)
+        statement = statement.on_conflict_do_update(
+            index_elements=[score_table.c.product_id, score_table.c.kind],
+            set_={"score": statement.excluded.score, "scored_at": statement.excluded.scored_at},
+        )
+        try:
+            if rows:
+                db.execute(statement, rows)
+            db.commit()
+        except Exception:
+            with self._lock:
+                self.dirty |= dirty # Retry on the next run
+            raise
+        return len(dirty)
+
+
+product_rankings = ProductRankings()
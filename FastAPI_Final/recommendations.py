@@ -0,0 +1,158 @@
+# recommendations.py
+import math
+import sys
+from typing import List, Tuple
+
+from sqlalchemy import Column, Float, Index, Integer, MetaData, Table, func, literal, select, union, union_all
+from sqlalchemy.orm import Session
+
+import models
+
+NEIGHBORS_PER_PRODUCT = 20 # "Customers also bought" entries kept per product
+MIN_PAIR_ORDERS = 2 # Pairs bought together fewer times than this are noise, not a signal
+SCORING = "cosine" # "cosine" or "lift"
+SCORING_OPTIONS = ("cosine", "lift")
+REBUILD_INTERVAL_SECONDS = 24 * 60 * 60
+
+neighbor_table = models.ProductNeighbor.__table__
+order_table = models.Order.__table__
+line_item_table = models.OrderLineItem.__table__
+archived_order_table = models.ArchivedOrder.__table__
+archived_line_item_table = models.ArchivedOrderLineItem.__table__
+
+# Scratch tables for a rebuild; TEMPORARY, so they live on the rebuilding connection only
+_scratch = MetaData()
+basket_table = Table( # One row per (order, product)
+    "recommendation_baskets", _scratch,
+    Column("order_id", Integer, nullable=False),
+    Column("product_id", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+Index("ix_recommendation_baskets_order", basket_table.c.order_id, basket_table.c.product_id)
+product_count_table = Table( # Orders per product
+    "recommendation_product_counts", _scratch,
+    Column("product_id", Integer, primary_key=True),
+    Column("orders", Integer, nullable=False),
+    Column("inv_sqrt", Float, nullable=False), # 1 / sqrt(orders), for cosine without SQL math functions
+    prefixes=["TEMPORARY"],
+)
+pair_table = Table( # Orders containing both products, product_id < neighbor_id
+    "recommendation_pairs", _scratch,
+    Column("product_id", Integer, nullable=False),
+    Column("neighbor_id", Integer, nullable=False),
+    Column("orders", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+
+def _pair_scores(scoring: str, total_orders: int):
+    """
+    Directed pairs (both orders of each unordered pair) with their score:
+    cosine = both / sqrt(orders_a * orders_b), lift = both * total / (orders_a * orders_b).
+    """
+    directed = union_all(
+        select(pair_table.c.product_id, pair_table.c.neighbor_id, pair_table.c.orders),
+        select(pair_table.c.neighbor_id.label("product_id"), pair_table.c.product_id.label("neighbor_id"), pair_table.c.orders),
+    ).subquery()
+    counts_a = product_count_table.alias("counts_a")
+    counts_b = product_count_table.alias("counts_b")
+    if scoring == "lift":
+        score = directed.c.orders * literal(float(total_orders)) / (counts_a.c.orders * counts_b.c.orders)
+    else:
+        score = directed.c.orders * counts_a.c.inv_sqrt * counts_b.c.inv_sqrt
+    return (
+        select(directed.c.product_id, directed.c.neighbor_id, directed.c.orders, score.label("score"))
+        .select_from(
+            directed.join(counts_a, counts_a.c.product_id == directed.c.product_id)
+            .join(counts_b, counts_b.c.product_id == directed.c.neighbor_id)
+        )
+    ).subquery()
+
+
+def rebuild(db: Session, scoring: str = SCORING, neighbors: int = NEIGHBORS_PER_PRODUCT, min_pair_orders: int = MIN_PAIR_ORDERS) -> int:
+    """
+    Recompute the top `neighbors` co-purchased products of every product from the line items of
+    current and archived orders that were not cancelled, as sales_rollups.rebuild does. It uses
+    set-based statements only: distinct baskets, a self-join counting pairs, and a ROW_NUMBER()
+    window that keeps the best pairs per product.
+    The product_neighbors table is replaced in the caller's transaction; the caller commits.
+    Returns the number of neighbor rows written.
+    """
+    connection = db.connection()
+    _scratch.drop_all(bind=connection)
+    _scratch.create_all(bind=connection)
+    try:
+        connection.execute(basket_table.insert().from_select(
+            ["order_id", "product_id"],
+            union(*( # UNION also drops repeated (order, product) lines
+                select(source_lines.c.order_id, source_lines.c.product_id)
+                .select_from(source_lines.join(source_orders, source_orders.c.id == source_lines.c.order_id))
+                .where(source_lines.c.product_id.isnot(None), source_orders.c.status != models.OrderStatus.CANCELLED)
+                for source_orders, source_lines in ((order_table, line_item_table), (archived_order_table, archived_line_item_table))
+            )),
+        ))
+
+        total_orders = connection.execute(select(func.count(func.distinct(basket_table.c.order_id)))).scalar()
+        counts = connection.execute(
+            select(basket_table.c.product_id, func.count()).group_by(basket_table.c.product_id)
+        ).all()
+        if counts:
+            connection.execute(product_count_table.insert(), [
+                {"product_id": product_id, "orders": orders, "inv_sqrt": 1.0 / math.sqrt(orders)} for product_id, orders in counts
+            ])
+
+        basket_a = basket_table.alias("basket_a")
+        basket_b = basket_table.alias("basket_b")
+        connection.execute(pair_table.insert().from_select(
+            ["product_id", "neighbor_id", "orders"],
+            select(basket_a.c.product_id, basket_b.c.product_id, func.count())
+            .select_from(basket_a.join(basket_b, (basket_b.c.order_id == basket_a.c.order_id) & (basket_b.c.product_id > basket_a.c.product_id)))
+            .group_by(basket_a.c.product_id, basket_b.c.product_id)
+            .having(func.count() >= min_pair_orders),
+        ))
+
+        scored = _pair_scores(scoring, total_orders)
+        rank = func.row_number().over(partition_by=scored.c.product_id, order_by=(scored.c.score.desc(), scored.c.neighbor_id)).label("rank")
+        ranked = select(scored.c.product_id, rank, scored.c.neighbor_id, scored.c.score, scored.c.orders).subquery()
+        connection.execute(neighbor_table.delete())
+        written = connection.execute(neighbor_table.insert().from_select(
+            ["product_id", "rank", "neighbor_id", "score", "orders"],
+            select(ranked.c.product_id, ranked.c.rank, ranked.c.neighbor_id, ranked.c.score, ranked.c.orders)
+            .where(ranked.c.rank <= neighbors)
+            .where(select(models.Product.id).where(models.Product.id == ranked.c.product_id).exists()) # Skip deleted products
+            .where(select(models.Product.id).where(models.Product.id == ranked.c.neighbor_id).exists()),
+        )).rowcount
+    finally:
+        _scratch.drop_all(bind=connection)
+    return written
+
+
+def rebuild_job(db: Session) -> None:
+    rebuild(db)
+    db.commit()
+
+
+def neighbors_of(db: Session, product_id: int, limit: int) -> List[Tuple[int, float, int]]:
+    """
+    (neighbor_id, score, orders) for a product, best first: a primary-key range read.
+    """
+    return db.execute(
+        select(neighbor_table.c.neighbor_id, neighbor_table.c.score, neighbor_table.c.orders)
+        .where(neighbor_table.c.product_id == product_id)
+        .order_by(neighbor_table.c.rank)
+        .limit(limit)
+    ).all()
+
+
+if __name__ == "__main__": # python recommendations.py rebuild [cosine|lift]
+    from database import SessionLocal, engine
+    if not sys.argv[1:] or sys.argv[1] != "rebuild" or len(sys.argv) > 3 or (len(sys.argv) == 3 and sys.argv[2] not in SCORING_OPTIONS):
+        sys.exit("usage: python recommendations.py rebuild [cosine|lift]")
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        written = rebuild(db, scoring=sys.argv[2] if len(sys.argv) == 3 else SCORING)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt product recommendations: {written} neighbor rows")
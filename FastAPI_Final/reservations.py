@@ -0,0 +1,124 @@
+# reservations.py
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, func, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+
+RESERVATION_TTL_SECONDS = 15 * 60 # How long adding to the cart holds stock
+SWEEP_INTERVAL_SECONDS = 30
+SWEEP_BATCH_SIZE = 500 # Expired holds deleted per transaction
+
+reservation_table = models.StockReservation.__table__
+product_table = models.Product.__table__
+
+
+def held_by_others(product_id, user_id, now: datetime):
+    """
+    Correlated scalar subquery: stock held by live reservations of other users for a product.
+    Served from ix_stock_reservations_product_expiry without touching the table.
+    """
+    return (
+        select(func.coalesce(func.sum(reservation_table.c.quantity), 0))
+        .where(
+            reservation_table.c.product_id == product_id,
+            reservation_table.c.expires_at > now,
+            reservation_table.c.user_id != user_id,
+        )
+        .scalar_subquery()
+    )
+
+
+def available_stock(db: Session, product_ids: Iterable[int], exclude_user_id: Optional[int] = None) -> Dict[int, dict]:
+    """
+    Physical stock, live holds and available stock (physical minus holds) for many products in one query.
+    Holds of `exclude_user_id` are not subtracted, so a user is never blocked by their own cart.
+    """
+    now = datetime.utcnow()
+    hold_filter = [reservation_table.c.expires_at > now]
+    if exclude_user_id is not None:
+        hold_filter.append(reservation_table.c.user_id != exclude_user_id)
+    held = (
+        select(reservation_table.c.product_id, func.sum(reservation_table.c.quantity).label("held"))
+        .where(reservation_table.c.product_id.in_(list(product_ids)), *hold_filter)
+        .group_by(reservation_table.c.product_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(product_table.c.id, product_table.c.quantity, func.coalesce(held.c.held, 0))
+        .select_from(product_table.outerjoin(held, held.c.product_id == product_table.c.id))
+        .where(product_table.c.id.in_(list(product_ids)))
+    )
+    return {
+        product_id: {"quantity": quantity or 0, "held": held_quantity, "available": max((quantity or 0) - held_quantity, 0)}
+        for product_id, quantity, held_quantity in rows
+    }
+
+
+def hold(db: Session, user_id: int, product_id: int, quantity: int) -> bool:
+    """
+    Reserve `quantity` units of a product for the user's cart line (replacing any previous hold) and
+    restart its TTL. The availability check and the write are one statement, so two carts cannot
+    reserve the same last unit. Returns False when not enough unreserved stock is left. The caller commits.
+    """
+    return hold_many(db, user_id, {product_id: quantity})
+
+
+def hold_many(db: Session, user_id: int, quantities: Dict[int, int]) -> bool:
+    """
+    hold() for several products with one executemany. Returns False unless every hold was granted;
+    the caller then rolls back (no partial holds are kept) and commits otherwise.
+    """
+    if not quantities:
+        return True
+    now = datetime.utcnow()
+    requested = (
+        select(
+            literal(user_id).label("user_id"),
+            bindparam("b_product_id").label("product_id"),
+            bindparam("b_quantity").label("quantity"),
+            literal(now + timedelta(seconds=RESERVATION_TTL_SECONDS)).label("expires_at"),
+        )
+        .select_from(product_table)
+        .where(
+            product_table.c.id == bindparam("b_product_id"),
+            func.coalesce(product_table.c.quantity, 0) - held_by_others(product_table.c.id, user_id, now) >= bindparam("b_quantity"),
+        )
+    )
+    statement = sqlite_insert(reservation_table).from_select(["user_id", "product_id", "quantity", "expires_at"], requested)
+    statement = statement.on_conflict_do_update(
+        index_elements=[reservation_table.c.user_id, reservation_table.c.product_id],
+        set_={"quantity": statement.excluded.quantity, "expires_at": statement.excluded.expires_at},
+    )
+    granted = db.execute(
+        statement, [{"b_product_id": product_id, "b_quantity": quantity} for product_id, quantity in quantities.items()]
+    ).rowcount
+    return granted == len(quantities)
+
+
+def release(db: Session, user_id: int, product_ids: Optional[List[int]] = None) -> None:
+    """
+    Drop the user's holds (all of them, or only for the given products). The caller commits.
+    """
+    statement = reservation_table.delete().where(reservation_table.c.user_id == user_id)
+    if product_ids is not None:
+        statement = statement.where(reservation_table.c.product_id.in_(product_ids))
+    db.execute(statement)
+
+
+def sweep_expired(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """
+    Delete expired holds in small batches so the sweeper never holds the write lock for long.
+    Expired holds are already ignored by availability checks; this only keeps the table small.
+    """
+    removed = 0
+    while True:
+        expired_ids = select(reservation_table.c.id).where(reservation_table.c.expires_at <= datetime.utcnow()).limit(batch_size)
+        deleted = db.execute(reservation_table.delete().where(reservation_table.c.id.in_(expired_ids))).rowcount
+        db.commit()
+        removed += deleted
+        if deleted < batch_size:
+            return removed
@@ -0,0 +1,45 @@
+# routers/analytics.py
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from database import get_db
+import schemas
+import auth
+import sales_rollups
+import serialization
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+)
+
+MAX_RANGE_DAYS = 3660 # Ten years of daily rows at most per request
+
+@router.get("/sales", response_model=schemas.SalesAnalyticsResponse) # GET /analytics/sales?start=...&end=...&group_by=... (admin only)
+def read_sales(
+    start: date,
+    end: date,
+    group_by: str = Query(default="day", description="day, month, category or product"),
+    category_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    limit: int = Query(default=100, ge=1, le=1000), # Rows returned for category and product grouping
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user),
+):
+    """
+    Units sold, revenue and order counts for a date range (inclusive, UTC), grouped by day, month,
+    category or product, optionally narrowed to one category or product. Cancelled orders are not
+    counted. Served from the sales rollup tables (admin only).
+    """
+    if not auth.is_admin(current_user.roles):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    if group_by not in sales_rollups.GROUP_BY_OPTIONS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"group_by must be one of: {', '.join(sales_rollups.GROUP_BY_OPTIONS)}")
+    if end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must not be before start")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Date range is limited to {MAX_RANGE_DAYS} days")
+    return serialization.json_response(sales_rollups.query_sales(db, start, end, group_by, category_id, product_id, limit))
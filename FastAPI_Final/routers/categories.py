@@ -8,6 +8,9 @@ from database import get_db
 import models
 import schemas
 import auth
+import cache
+import changefeed
+import typeahead
 
 router = APIRouter(
     prefix="/categories",
@@ -30,8 +33,11 @@ def create_category(
         raise HTTPException(status_code=409, detail="Category name already exists")
     db_category = models.Category(**category.dict())
     db.add(db_category)
+    db.flush() # Assign the id for the change feed
+    changefeed.record_changes(db, changefeed.CATEGORY, [db_category.id])
     db.commit()
     db.refresh(db_category)
+    typeahead.typeahead_index.category_saved(db_category.id, db_category.name, 0)
     return db_category
 
 # --- List Categories (Public - with pagination) ---
@@ -96,9 +102,12 @@ def update_category(
 
     for field, value in category_update.dict(exclude_unset=True).items():
         setattr(db_category, field, value)
+    changefeed.record_changes(db, changefeed.CATEGORY, [category_id])
     db.commit()
     db.refresh(db_category)
+    cache.invalidate_product_listings(category_id) # Listings embed the category name
     product_count = db.query(models.Product).filter(models.Product.category_id == db_category.id).count()
+    typeahead.typeahead_index.category_saved(db_category.id, db_category.name, product_count)
     category_schema = schemas.CategorySchema.from_orm(db_category)
     category_schema.product_count = product_count # Add product_count
     return category_schema
@@ -126,5 +135,8 @@ def delete_category(
         )
 
     db.delete(db_category)
+    changefeed.record_changes(db, changefeed.CATEGORY, [category_id], deleted=True)
     db.commit()
+    cache.invalidate_product_listings(category_id)
+    typeahead.typeahead_index.category_deleted(category_id)
     return {"message": "Category deleted successfully"}
\ No newline at end of file
@@ -1,9 +1,10 @@
 # routers/orders.py
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Header, Query
+from sqlalchemy import bindparam, func
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Optional, Set
 from database import get_db
-import models, schemas, auth
+import models, schemas, auth, cache, changefeed, typeahead, reservations, idempotency, serialization, cart_store, order_status, outbox, sales_rollups, rankings
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -14,38 +15,43 @@ router = APIRouter(
 
 # --- Cart Item Endpoints (OrderItem - for shopping cart) ---
 @router.post("/items/", response_model=schemas.OrderItemSchema, status_code=status.HTTP_201_CREATED) # POST /orders/items/ to add item to cart
-def create_cart_item(order_item: schemas.OrderItemCreate, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+def create_cart_item(
+    order_item: schemas.OrderItemCreate,
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER, max_length=255)
+):
     """
     Add a product to the user's shopping cart (customer or admin).
     If the item is already in the cart, it increases the quantity. Otherwise, it adds a new item.
+    The cart quantity is reserved for reservations.RESERVATION_TTL_SECONDS; stock held by other carts is not available.
+    With an Idempotency-Key header, retries replay the first response instead of adding the quantity again.
     """
     user_id = auth.get_current_user_local_db(current_user, db).id
+    response = idempotency.run(
+        db, user_id, idempotency_key, "POST /orders/items/", order_item, schemas.OrderItemSchema, status.HTTP_201_CREATED,
+        lambda: _add_cart_item(db, user_id, order_item)
+    )
+    cache.invalidate_cart_summary(current_user.username)
+    return response
+
+def _add_cart_item(db: Session, user_id: int, order_item: schemas.OrderItemCreate):
     db_product = db.query(models.Product).filter(models.Product.id == order_item.product_id).first()
     if not db_product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    if db_product.quantity < order_item.quantity:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Insufficient stock for '{db_product.name}'. Only {db_product.quantity} available.")
 
     # Check if item already in cart
-    db_cart_item = db.query(models.OrderItem).filter(
-        models.OrderItem.user_id == user_id,
-        models.OrderItem.product_id == order_item.product_id
-    ).first()
-
-    if db_cart_item: # If item exists, update quantity
-        db_cart_item.quantity += order_item.quantity
-    else: # If item not in cart, create new cart item
-        db_cart_item = models.OrderItem(
-            user_id=user_id,
-            product_id=order_item.product_id,
-            quantity=order_item.quantity,
-            price=db_product.price # Store current price in cart item
-        )
-        db.add(db_cart_item)
+    db_cart_item = cart_store.store.find_lines(db, user_id, [db_product.id]).get(db_product.id)
 
-    db.commit()
-    db.refresh(db_cart_item)
-    return db_cart_item
+    cart_quantity = order_item.quantity + (db_cart_item.quantity if db_cart_item else 0) # If item exists, increase its quantity
+    if not reservations.hold(db, user_id, db_product.id, cart_quantity):
+        db.rollback()
+        available = reservations.available_stock(db, [db_product.id], exclude_user_id=user_id)[db_product.id]["available"]
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Insufficient stock for '{db_product.name}'. Only {available} available.")
+
+    product_id = db_product.id
+    cart_store.store.set_quantities(db, user_id, {product_id: cart_quantity}, {product_id: db_product.price}) # New lines store the current price
+    return cart_store.store.find_lines(db, user_id, [product_id], with_products=True)[product_id]
 
 
 @router.get("/items/", response_model=List[schemas.OrderItemSchema]) # GET /orders/items/ to view cart items
@@ -55,142 +61,396 @@ def read_cart_items_for_current_user(db: Session = Depends(get_db), current_user
     Returns a list of OrderItem objects that have order_id = NULL (cart items).
     """
     user_id = auth.get_current_user_local_db(current_user, db).id
-    cart_items = db.query(models.OrderItem).filter(models.OrderItem.user_id == user_id).all() # Corrected to use .is_(None)
+    cart_items = cart_store.store.get_lines(db, user_id, with_products=True)
     return cart_items
 
+@router.get("/items/summary", response_model=schemas.CartSummarySchema) # GET /orders/items/summary for cart totals
+def read_cart_summary(db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+    """
+    Get line totals, item count and grand total of the current user's cart (customer or admin).
+    Computed by one aggregate query with the SQL cart store and cached per
+    user until their cart changes, so repeated calls (e.g. the header cart badge) hit no database.
+    """
+    cache_key = ("cart_summary", current_user.username)
+    cached_body = cache.cart_summary_cache.get(cache_key)
+    if cached_body is not None:
+        return serialization.json_response(body=cached_body)
+    cache_generation = cache.cart_summary_cache.generation() # Before reading, so a concurrent cart change keeps this summary out of the cache
+
+    summary = cart_store.store.summary(db, current_user.username)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="User not found in local database")
+    body = serialization.dumps(summary)
+    cache.cart_summary_cache.set(cache_key, body, tags=[("cart", current_user.username)], generation=cache_generation)
+    return serialization.json_response(body=body)
+
+@router.put("/items/", response_model=List[schemas.OrderItemSchema]) # PUT /orders/items/ to sync several cart lines at once
+def bulk_update_cart_items(cart_update: schemas.CartBulkUpdate, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+    """
+    Apply a list of cart changes in one transaction and return the updated cart (customer or admin).
+    Each entry sets the quantity of a product's cart line: a product not yet in the cart is added,
+    an existing line is updated, and quantity 0 removes it. Products not listed are left as they are.
+    Either every change is applied (and its stock reserved) or none is. Setting absolute quantities
+    makes the request safe to retry.
+    """
+    user_id = auth.get_current_user_local_db(current_user, db).id
+    changes = {}
+    for change in cart_update.items:
+        if change.quantity < 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quantity cannot be negative")
+        if change.product_id in changes:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Duplicate product_id {change.product_id} in cart update")
+        changes[change.product_id] = change.quantity
+
+    # --- One query for the products, one for the affected cart lines ---
+    products = {product.id: product for product in db.query(models.Product).filter(models.Product.id.in_(list(changes)))} if changes else {}
+    missing_product_ids = [product_id for product_id, quantity in changes.items() if quantity and product_id not in products]
+    if missing_product_ids:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Products not found: {missing_product_ids}")
+
+    kept = {product_id: quantity for product_id, quantity in changes.items() if quantity > 0}
+    if not reservations.hold_many(db, user_id, kept):
+        db.rollback()
+        available = reservations.available_stock(db, kept, exclude_user_id=user_id)
+        short_product_id = next((product_id for product_id, quantity in kept.items() if available[product_id]["available"] < quantity), None)
+        if short_product_id is None: # Released in the meantime
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Stock changed during cart update. Please try again.")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient stock for '{products[short_product_id].name}'. Only {available[short_product_id]['available']} available."
+        )
+
+    removed_product_ids = [product_id for product_id, quantity in changes.items() if quantity == 0]
+    if removed_product_ids:
+        reservations.release(db, user_id, removed_product_ids)
+    cart_store.store.set_quantities(db, user_id, changes, {product_id: product.price for product_id, product in products.items()})
+    db.commit()
+    cache.invalidate_cart_summary(current_user.username)
+
+    return cart_store.store.get_lines(db, user_id, with_products=True)
+
 @router.delete("/items/{order_item_id}", response_model=schemas.OrderItemSchema) # DELETE /orders/items/{order_item_id} to delete cart item
 def delete_cart_item(order_item_id: int, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
     """
     Delete a specific item from the user's shopping cart (customer or admin).
     """
     user_id = auth.get_current_user_local_db(current_user, db).id
-    db_cart_item = db.query(models.OrderItem).options(joinedload(models.OrderItem.product)).filter( # <--- Eager load product relationship
-        models.OrderItem.id == order_item_id,
-        models.OrderItem.user_id == user_id
-    ).first()
+    db_cart_item = cart_store.store.get_line(db, user_id, order_item_id) # Product is loaded with the line
     if not db_cart_item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart item not found")
-    db.delete(db_cart_item)
+    deleted_item = schemas.OrderItemSchema.from_orm(db_cart_item) # Serialize before the commit expires the row
+    cart_store.store.remove_lines(db, user_id, [db_cart_item.id])
+    reservations.release(db, user_id, [db_cart_item.product_id])
     db.commit()
-    return db_cart_item
+    cache.invalidate_cart_summary(current_user.username)
+    return deleted_item
 
 @router.put("/items/{order_item_id}", response_model=schemas.OrderItemSchema) # PUT /orders/items/{order_item_id} to update cart item quantity
 def update_cart_item_quantity(order_item_id: int, order_item_update: schemas.OrderItemCreate, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
     """
     Update the quantity of a specific item in the user's shopping cart (customer or admin).
     """
+    if order_item_update.quantity < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quantity must be at least 1. Delete the cart item to remove it.")
     user_id = auth.get_current_user_local_db(current_user, db).id
-    db_cart_item = db.query(models.OrderItem).filter(models.OrderItem.id == order_item_id, models.OrderItem.user_id == user_id).first() # Corrected to use .is_(None)
+    db_cart_item = cart_store.store.get_line(db, user_id, order_item_id)
     if not db_cart_item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart item not found")
 
-    db_product = db.query(models.Product).filter(models.Product.id == order_item_update.product_id).first()
+    db_product = db_cart_item.product
     if not db_product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    if db_product.quantity < order_item_update.quantity:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Insufficient stock for '{db_product.name}'. Only {db_product.quantity} available.")
+    if not reservations.hold(db, user_id, db_product.id, order_item_update.quantity): # Re-reserve and restart the TTL
+        db.rollback()
+        available = reservations.available_stock(db, [db_product.id], exclude_user_id=user_id)[db_product.id]["available"]
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Insufficient stock for '{db_product.name}'. Only {available} available.")
 
-    db_cart_item.quantity = order_item_update.quantity
+    product_id = db_product.id
+    cart_store.store.set_quantities(db, user_id, {product_id: order_item_update.quantity}, {})
     db.commit()
-    db.refresh(db_cart_item)
-    return db_cart_item
+    cache.invalidate_cart_summary(current_user.username)
+    return cart_store.store.get_line(db, user_id, order_item_id)
 
 
 # --- Order Endpoints (Order and OrderLineItem - for placed orders) ---
+# Loads user + roles and line items + products + categories with one batched IN query per relationship
+# (six queries for any page size) instead of lazy loads per order, line item and product.
+ORDER_GRAPH_OPTIONS = (
+    selectinload(models.Order.user).selectinload(models.User.roles),
+    selectinload(models.Order.order_line_items).selectinload(models.OrderLineItem.product).selectinload(models.Product.category),
+)
+
+ORDER_FIELDS = ("id", "user_id", "order_date", "status", "order_line_items", "order_line_items.product", "user")
+ORDER_FIELDS_DESCRIPTION = "Comma-separated subset of: " + ", ".join(ORDER_FIELDS) + ". Relationships not listed are not loaded."
+ARCHIVED_DESCRIPTION = "List archived orders (delivered or cancelled orders moved out by the archival job) instead of current ones."
+
+def order_models(archived: bool = False):
+    """
+    (order model, line item model) for the hot or the archive tables; both have the same attributes.
+    """
+    if archived:
+        return models.ArchivedOrder, models.ArchivedOrderLineItem
+    return models.Order, models.OrderLineItem
+
+def parse_order_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """
+    Parse a `fields` query parameter; None means the full order.
+    """
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(ORDER_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(ORDER_FIELDS)}")
+    if "order_line_items.product" in requested:
+        requested.add("order_line_items")
+    return requested
+
+def order_graph_options(fields: Optional[Set[str]], archived: bool = False) -> list:
+    """
+    Loader options for the relationships a response needs.
+    """
+    if fields is None and not archived:
+        return list(ORDER_GRAPH_OPTIONS)
+    order_model, line_item_model = order_models(archived)
+    options = []
+    if fields is None or "user" in fields:
+        options.append(selectinload(order_model.user).selectinload(models.User.roles))
+    if fields is None or "order_line_items" in fields:
+        line_items = selectinload(order_model.order_line_items)
+        if fields is None or "order_line_items.product" in fields:
+            line_items = line_items.selectinload(line_item_model.product).selectinload(models.Product.category)
+        options.append(line_items)
+    return options
+
+def _orders_response(orders: List[models.Order], fields: Optional[Set[str]] = None):
+    user_dicts = {} # Each user is converted once per page
+    return serialization.json_response([serialization.order_dict(order, user_dicts, fields) for order in orders])
+
+def _order_summaries_response(db: Session, skip: int, limit: int, user_id: Optional[int] = None, order_status: Optional[models.OrderStatus] = None, archived: bool = False):
+    """
+    One GROUP BY query over orders and their line items; no relationship is loaded.
+    """
+    order, line_item = order_models(archived)
+    query = (
+        db.query(
+            order.id,
+            order.user_id,
+            order.order_date,
+            order.status,
+            func.count(line_item.id),
+            func.coalesce(func.sum(line_item.quantity), 0),
+            func.coalesce(func.round(func.sum(line_item.quantity * line_item.price), 2), 0.0),
+        )
+        .outerjoin(line_item, line_item.order_id == order.id)
+    )
+    if user_id is not None:
+        query = query.filter(order.user_id == user_id)
+    if order_status is not None:
+        query = query.filter(order.status == order_status)
+    rows = query.group_by(order.id).order_by(order.id).offset(skip).limit(limit).all()
+    return serialization.json_response([
+        {
+            "id": order_id,
+            "user_id": order_user_id,
+            "order_date": order_date,
+            "status": order_status_value.value if order_status_value is not None else None,
+            "line_count": line_count,
+            "item_count": item_count,
+            "total": total,
+        }
+        for order_id, order_user_id, order_date, order_status_value, line_count, item_count, total in rows
+    ])
+
 @router.post("/", response_model=schemas.OrderSchema, status_code=status.HTTP_201_CREATED) # POST /orders/ to place order from cart
-def create_order_from_cart(order_create: schemas.OrderCreate, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+def create_order_from_cart(
+    order_create: schemas.OrderCreate,
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER, max_length=255)
+):
     """
     Create a new order by converting items from the user's shopping cart (customer or admin).
-    Takes items from the current user's cart (OrderItem table where order_id is NULL),
-    creates a new Order and OrderLineItems, and empties the cart (deletes cart items).
+    Takes items from the current user's cart (the active cart store), creates a new Order and OrderLineItems,
+    and empties the cart (deletes cart items).
+    Runs as a single transaction: stock is decremented with conditional UPDATEs (quantity minus other
+    carts' live holds >= n), so concurrent checkouts cannot oversell, and any failure leaves stock,
+    order and cart untouched. The user's holds are consumed by the order.
+    With an Idempotency-Key header, retries (including concurrent ones) get the first order back instead of placing another.
     """
     user_id = auth.get_current_user_local_db(current_user, db).id
-    cart_items = db.query(models.OrderItem).filter(models.OrderItem.user_id == user_id, models.OrderItem.order_id.is_(None)).all() # Corrected to use .is_(None)
+    response = idempotency.run(
+        db, user_id, idempotency_key, "POST /orders/", order_create, schemas.OrderSchema, status.HTTP_201_CREATED,
+        lambda: _place_order_from_cart(db, user_id, current_user)
+    )
+    cache.invalidate_cart_summary(current_user.username) # The cart was emptied
+    return response
+
+def _place_order_from_cart(db: Session, user_id: int, current_user: auth.TokenData) -> models.Order:
+    cart_items = cart_store.store.get_lines(db, user_id)
     if not cart_items:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot create order with an empty cart.")
 
-    db_order_line_items_for_order = [] # To hold OrderLineItems to be created
-    total_quantity = 0
-    total_amount = 0
-
+    ordered_quantities = {} # product_id -> total quantity in this order
     for cart_item in cart_items:
-        db_product = db.query(models.Product).filter(models.Product.id == cart_item.product_id).first()
-        if db_product.quantity < cart_item.quantity:
+        ordered_quantities[cart_item.product_id] = ordered_quantities.get(cart_item.product_id, 0) + cart_item.quantity
+    products = {
+        product.id: product
+        for product in db.query(models.Product).filter(models.Product.id.in_(list(ordered_quantities)))
+    }
+    missing_product_ids = [product_id for product_id in ordered_quantities if product_id not in products]
+    if missing_product_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Products no longer available: {missing_product_ids}")
+    product_categories = {product.id: product.category_id for product in products.values()} # Read before commit expires the objects
+
+    rankings.product_rankings.ensure_loaded(db) # Before this order reaches the rollups it may bootstrap from
+    product_table = models.Product.__table__
+    try:
+        # Decrement stock only where enough is left at write time once other carts' holds are set
+        # aside; SQLite serializes writers, so the check and the decrement are atomic.
+        held_elsewhere = reservations.held_by_others(product_table.c.id, user_id, datetime.utcnow())
+        decremented = db.execute(
+            product_table.update()
+            .where(product_table.c.id == bindparam("b_product_id"), product_table.c.quantity - held_elsewhere >= bindparam("b_quantity"))
+            .values(quantity=product_table.c.quantity - bindparam("b_quantity")),
+            [{"b_product_id": product_id, "b_quantity": quantity} for product_id, quantity in ordered_quantities.items()],
+        ).rowcount
+        if decremented != len(ordered_quantities):
+            db.rollback()
+            stock = {product_id: row["available"] for product_id, row in reservations.available_stock(db, ordered_quantities, exclude_user_id=user_id).items()}
+            short_product_id = next((product_id for product_id, quantity in ordered_quantities.items() if (stock.get(product_id) or 0) < quantity), None)
+            if short_product_id is None: # Restocked in the meantime
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Stock changed during checkout. Please try again.")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient stock for '{db_product.name}'. Only {db_product.quantity} available."
+                detail=f"Insufficient stock for '{products[short_product_id].name}'. Only {stock.get(short_product_id) or 0} available."
             )
 
-        # Create OrderLineItem from cart item
-        db_order_line_item = models.OrderLineItem(
-            order_id=None, # Order ID will be set after Order is created
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-            price=cart_item.price # Use price from cart item (price at time of cart addition)
-        )
-        db_order_line_items_for_order.append(db_order_line_item) # Add to list for association with Order
-        total_quantity += cart_item.quantity
-        total_amount += cart_item.price * cart_item.quantity
-        db_product.quantity -= cart_item.quantity # Reduce product quantity
-
-
-    db_order = models.Order(
-        user_id=user_id,
-        order_date=datetime.utcnow(),
-        status="pending",
-        order_line_items=db_order_line_items_for_order # Associate OrderLineItems with Order
-    )
-
-    try:
+        db_order = models.Order(user_id=user_id, order_date=datetime.utcnow(), status=models.OrderStatus.PENDING)
         db.add(db_order)
-        db.commit()
-        db.refresh(db_order)
-
-        # Now that order is created and has an ID, set order_id for order_line_items
-        for db_order_line_item in db_order_line_items_for_order:
-            db_order_line_item.order_id = db_order.id
-
-        db.commit() # Commit again to update order_line_items with order_id
-
-        # --- DELETE CART ITEMS AFTER ORDER CREATION (Empty the cart) ---
-        for cart_item in cart_items:
-            db.delete(cart_item) # Delete each cart item from the database
-        db.commit() # Commit the deletion of cart items
-
-
-        return read_order(order_id=db_order.id, db=db, current_user=current_user) # Return full order details using read_order function
+        db.flush() # Assign the order id for the line items
+        order_id = db_order.id
+
+        db.execute(models.OrderLineItem.__table__.insert(), [
+            {
+                "order_id": order_id,
+                "product_id": cart_item.product_id,
+                "category_id": product_categories[cart_item.product_id], # Sales stay in this category if the product moves
+                "quantity": cart_item.quantity,
+                "price": cart_item.price, # Use price from cart item (price at time of cart addition)
+            }
+            for cart_item in cart_items
+        ])
+
+        # --- Empty the cart; a concurrent checkout of the same cart would already have removed these rows ---
+        cart_item_ids = [cart_item.id for cart_item in cart_items]
+        deleted = cart_store.store.remove_lines(db, user_id, cart_item_ids)
+        if deleted != len(cart_item_ids):
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Cart changed during checkout. Please review your cart and try again.")
+
+        reservations.release(db, user_id, list(ordered_quantities)) # Held stock is now sold
+        changefeed.record_changes(db, changefeed.PRODUCT, list(ordered_quantities)) # Stock changed
+        sales_rollups.apply_lines(db, [
+            (order_id, db_order.order_date, cart_item.product_id, product_categories[cart_item.product_id], cart_item.quantity, cart_item.price)
+            for cart_item in cart_items
+        ], 1)
+        outbox.record_events(db, outbox.ORDER_CREATED, [{
+            "order_id": order_id,
+            "user_id": user_id,
+            "status": models.OrderStatus.PENDING.value,
+            "order_date": db_order.order_date,
+            "items": [{"product_id": cart_item.product_id, "quantity": cart_item.quantity, "price": cart_item.price} for cart_item in cart_items],
+            "total": sum(cart_item.quantity * cart_item.price for cart_item in cart_items),
+        }])
+        db.flush() # idempotency.run commits, together with the stored response
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback() # Rollback product quantity changes if order fails
+        db.rollback() # Nothing from this checkout is kept
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not create order. Database error: {e}")
 
+    stock = dict(db.query(models.Product.id, models.Product.quantity).filter(models.Product.id.in_(list(ordered_quantities))))
+    idempotency.after_commit(db, lambda: _order_placed(ordered_quantities, product_categories, stock))
+    return read_order(order_id=order_id, db=db, current_user=current_user, fields=None) # Return full order details using read_order function
+
+def _order_placed(ordered_quantities: dict, product_categories: dict, stock: dict) -> None:
+    # In-process caches and indexes only see the order once it has committed
+    cache.invalidate_product_listings(*set(product_categories.values()))
+    rankings.product_rankings.record_sales(ordered_quantities, product_categories)
+    for product_id, quantity in stock.items():
+        typeahead.typeahead_index.product_stock_changed(product_id, quantity)
+
 @router.get("/{order_id}", response_model=schemas.OrderSchema) # GET /orders/{order_id} to view order details
-def read_order(order_id: int, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+def read_order(
+    order_id: int,
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user),
+    fields: Optional[str] = Query(default=None, description=ORDER_FIELDS_DESCRIPTION)
+):
     """
     Get details of a specific order by order ID.
     Admins can view any order, customers can only view their own orders.
-    Includes associated order line items and user details.
+    Includes associated order line items and user details, unless `fields` narrows the response.
+    Archived orders are found as well.
     """
+    requested_fields = parse_order_fields(fields)
     user_id = auth.get_current_user_local_db(current_user, db).id
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    db_order = db.query(models.Order).options(*order_graph_options(requested_fields)).filter(models.Order.id == order_id).first()
+    if not db_order: # Old delivered and cancelled orders live in the archive
+        db_order = db.query(models.ArchivedOrder).options(*order_graph_options(requested_fields, archived=True)).filter(models.ArchivedOrder.id == order_id).first()
     if not db_order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
 
     if not auth.is_admin(current_user.roles) and db_order.user_id != user_id: # Re-introduce authorization check with correct logic
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view this order") # More specific error message
+    if requested_fields is not None:
+        return serialization.json_response(serialization.order_dict(db_order, {}, requested_fields))
     return db_order
 
 @router.get("/customer/me/", response_model=List[schemas.OrderSchema]) # GET /orders/customer/me/ to view current customer's orders
-def read_customer_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+def read_customer_orders(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user),
+    fields: Optional[str] = Query(default=None, description=ORDER_FIELDS_DESCRIPTION),
+    archived: bool = Query(default=False, description=ARCHIVED_DESCRIPTION)
+):
     """
     Get a list of orders placed by the current customer (customer or admin - but only current customer's orders for customer).
     Supports pagination using skip and limit parameters.
     """
+    requested_fields = parse_order_fields(fields)
     user_id = auth.get_current_user_local_db(current_user, db).id
-    orders = db.query(models.Order).filter(models.Order.user_id == user_id).offset(skip).limit(limit).all()
-    return orders
+    order = order_models(archived)[0]
+    orders = db.query(order).options(*order_graph_options(requested_fields, archived)).filter(order.user_id == user_id).offset(skip).limit(limit).all()
+    return _orders_response(orders, requested_fields)
+
+@router.get("/customer/me/summary/", response_model=List[schemas.OrderSummarySchema]) # GET /orders/customer/me/summary/ for a light order history
+def read_customer_order_summaries(
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    archived: bool = Query(default=False, description=ARCHIVED_DESCRIPTION),
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user)
+):
+    """
+    Get the current customer's orders as id, date, status, line count, item count and total.
+    """
+    user_id = auth.get_current_user_local_db(current_user, db).id
+    return _order_summaries_response(db, skip, limit, user_id=user_id, archived=archived)
 
 @router.get("/admin/customer/{customer_id}/", response_model=List[schemas.OrderSchema]) # GET /orders/admin/customer/{customer_id}/ to view orders for a specific customer (admin only)
-def read_orders_by_customer_admin(customer_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+def read_orders_by_customer_admin(
+    customer_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user),
+    fields: Optional[str] = Query(default=None, description=ORDER_FIELDS_DESCRIPTION),
+    archived: bool = Query(default=False, description=ARCHIVED_DESCRIPTION)
+):
     """
     Get a list of orders placed by a specific customer (admin only).
     Accessible only to admin users.
@@ -198,19 +458,48 @@ def read_orders_by_customer_admin(customer_id: int, skip: int = 0, limit: int =
     """
     if not auth.is_admin(current_user.roles):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
-    orders = db.query(models.Order).filter(models.Order.user_id == customer_id).offset(skip).limit(limit).all()
-    return orders
+    requested_fields = parse_order_fields(fields)
+    order = order_models(archived)[0]
+    orders = db.query(order).options(*order_graph_options(requested_fields, archived)).filter(order.user_id == customer_id).offset(skip).limit(limit).all()
+    return _orders_response(orders, requested_fields)
+
+@router.get("/admin/summary/", response_model=List[schemas.OrderSummarySchema]) # GET /orders/admin/summary/ for dashboards (admin only)
+def read_order_summaries_admin(
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    customer_id: Optional[int] = None,
+    order_status: Optional[models.OrderStatus] = Query(default=None, alias="status"),
+    archived: bool = Query(default=False, description=ARCHIVED_DESCRIPTION),
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user)
+):
+    """
+    Get orders as id, customer, date, status, line count, item count and total (admin only).
+    Totals are computed in SQL with GROUP BY; optionally filter by customer_id and status.
+    """
+    if not auth.is_admin(current_user.roles):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return _order_summaries_response(db, skip, limit, user_id=customer_id, order_status=order_status, archived=archived)
 
 @router.get("/", response_model=List[schemas.OrderSchema]) # GET /orders/ to view all orders (admin only) with pagination
-def read_orders_all_admin(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+def read_orders_all_admin(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: auth.TokenData = Depends(auth.get_current_user),
+    fields: Optional[str] = Query(default=None, description=ORDER_FIELDS_DESCRIPTION),
+    archived: bool = Query(default=False, description=ARCHIVED_DESCRIPTION)
+):
     """
     Get a list of all orders (admin only), with pagination.
     Accessible only to admin users.
     """
     if not auth.is_admin(current_user.roles):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
-    orders = db.query(models.Order).offset(skip).limit(limit).all()
-    return orders
+    requested_fields = parse_order_fields(fields)
+    order = order_models(archived)[0]
+    orders = db.query(order).options(*order_graph_options(requested_fields, archived)).offset(skip).limit(limit).all()
+    return _orders_response(orders, requested_fields)
 
 @router.delete("/{order_id}", response_model=schemas.OrderSchema)
 def delete_order(order_id: int, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
@@ -230,26 +519,75 @@ def delete_order(order_id: int, db: Session = Depends(get_db), current_user: aut
     if not db_order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
 
+    removed_lines = []
+    if db_order.status != models.OrderStatus.CANCELLED: # Cancelled orders were already taken out of the rollups
+        rankings.product_rankings.ensure_loaded(db) # Before the rollups lose the order, as in checkout
+        removed_lines = sales_rollups.remove_orders(db, [order_id])
     db.delete(db_order)
     db.commit()
+    rankings.product_rankings.remove_sales(removed_lines)
     return db_order
 
 class OrderStatusUpdate(BaseModel): # Request body for updating order status
-    status: str # e.g., "pending", "processing", "shipped", "completed", "cancelled"
+    status: models.OrderStatus # "pending", "processing", "shipped", "delivered" or "cancelled"
+
+class OrderStatusBulkUpdate(BaseModel): # Request body for moving many orders to one status
+    order_ids: List[int]
+    status: models.OrderStatus
+
+MAX_BULK_STATUS_ORDERS = 5000
+
+def _transition_orders(db: Session, order_ids: List[int], target: models.OrderStatus) -> List[dict]:
+    """
+    Apply a status change and commit; after a cancellation, take the orders out of the rankings and
+    refresh caches for the restocked products.
+    """
+    if target == models.OrderStatus.CANCELLED:
+        rankings.product_rankings.ensure_loaded(db) # Before the rollups lose the orders, as in checkout
+    try:
+        results, restocked_product_ids, cancelled_lines = order_status.transition_orders(db, order_ids, target)
+        db.commit()
+    except order_status.ConcurrentStatusChange:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Orders changed during the status update. Please try again.")
+    rankings.product_rankings.remove_sales(cancelled_lines)
+    if restocked_product_ids:
+        restocked = db.query(models.Product.id, models.Product.quantity, models.Product.category_id).filter(models.Product.id.in_(list(restocked_product_ids))).all()
+        cache.invalidate_product_listings(*{category_id for _, _, category_id in restocked})
+        for product_id, quantity, _ in restocked:
+            typeahead.typeahead_index.product_stock_changed(product_id, quantity)
+    return results
+
+@router.put("/bulk/status/", response_model=schemas.OrderStatusBulkResponse) # PUT /orders/bulk/status/ to move many orders to one status (admin only)
+def update_order_status_bulk(status_update: OrderStatusBulkUpdate, db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
+    """
+    Move many orders to one status in a single transaction (admin only).
+    Each order is checked against models.ORDER_STATUS_TRANSITIONS; allowed ones are updated with one
+    UPDATE per current status, the rest are reported. Cancelled orders are restocked in the same transaction.
+    Returns one compact result per order id instead of the full orders.
+    """
+    if not auth.is_admin(current_user.roles):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    if len(status_update.order_ids) > MAX_BULK_STATUS_ORDERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BULK_STATUS_ORDERS} orders per request")
+    results = _transition_orders(db, status_update.order_ids, status_update.status)
+    return serialization.json_response({
+        "updated": sum(1 for result in results if result["result"] == order_status.UPDATED),
+        "results": results,
+    })
 
 @router.put("/{order_id}/status/", response_model=schemas.OrderSchema) # PUT /orders/{order_id}/status/ to update order status (admin only)
 def update_order_status(order_id: int, status_update: OrderStatusUpdate = Body(...), db: Session = Depends(get_db), current_user: auth.TokenData = Depends(auth.get_current_user)):
     """
     Update the status of a specific order (admin only).
     Accessible only to admin users.
+    Only transitions allowed by models.ORDER_STATUS_TRANSITIONS are accepted; cancelling restocks the order's items.
     """
     if not auth.is_admin(current_user.roles):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not db_order:
+    result = _transition_orders(db, [order_id], status_update.status)[0]
+    if result["result"] == order_status.NOT_FOUND:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-
-    db_order.status = status_update.status # Update order status
-    db.commit()
-    db.refresh(db_order)
-    return db_order
\ No newline at end of file
+    if result["result"] == order_status.INVALID_TRANSITION:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Cannot change order status from '{result['status']}' to '{status_update.status.value}'")
+    return db.query(models.Order).options(*ORDER_GRAPH_OPTIONS).filter(models.Order.id == order_id).first()
\ No newline at end of file
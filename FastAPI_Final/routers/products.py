@@ -1,19 +1,80 @@
 # routers/products.py
+import base64
+import json
 from typing import List, Optional, Dict
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, tuple_
+from sqlalchemy.orm import Session, joinedload
 
-from database import get_db
+from database import get_db, SessionLocal
 import models
 import schemas
 import auth
+import cache
+import catalog_import
+import catalog_export
+import changefeed
+import typeahead
+import serialization
+import reservations
+import rankings
+import recommendations
 
 router = APIRouter(
     prefix="/products",
     tags=["products"],
 )
 
+BULK_UPDATE_CHUNK_SIZE = 500 # Products updated per statement and transaction
+MAX_BATCH_IDS = 1000 # Products per batch lookup request
+IN_QUERY_CHUNK_SIZE = 500 # Ids per IN (...) clause, well below SQLite's bound-parameter limit
+
+# Listing sort orders: sort_by value -> (sort column, descending). Ties are broken by id in the
+# same direction; each order is served by a matching (category_id, column, id) index in models.py.
+PRODUCT_SORT_ORDERS = {
+    "price_asc": (models.Product.price, False),
+    "price_desc": (models.Product.price, True),
+    "name_asc": (models.Product.name, False),
+    "name_desc": (models.Product.name, True),
+    "stock_asc": (models.Product.quantity, False),
+    "stock_desc": (models.Product.quantity, True),
+    "newest": (models.Product.id, True),
+}
+
+def encode_cursor(sort_value, product_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, product_id]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        sort_value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return sort_value, int(product_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def get_products_by_ids(db: Session, product_ids: List[int]) -> Dict[int, models.Product]:
+    """
+    Load products with their categories using one IN query per IN_QUERY_CHUNK_SIZE ids.
+    """
+    products = {}
+    product_ids = list(dict.fromkeys(product_ids))
+    for start in range(0, len(product_ids), IN_QUERY_CHUNK_SIZE):
+        chunk_ids = product_ids[start:start + IN_QUERY_CHUNK_SIZE]
+        query = db.query(models.Product).options(joinedload(models.Product.category)).filter(models.Product.id.in_(chunk_ids))
+        products.update((product.id, product) for product in query)
+    return products
+
+def _batch_response(db: Session, product_ids: List[int]) -> Response:
+    product_ids = list(dict.fromkeys(product_ids)) # Dedupe, keep the caller's order
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} product ids per request")
+    products = get_products_by_ids(db, product_ids)
+    return serialization.json_response({
+        "items": [serialization.product_dict(products[product_id]) for product_id in product_ids if product_id in products],
+        "missing_ids": [product_id for product_id in product_ids if product_id not in products],
+    })
+
 # --- Create Product (Admin Only) ---
 @router.post("/", response_model=schemas.ProductSchema, status_code=201)
 def create_product(
@@ -35,10 +96,98 @@ def create_product(
 
     db_product = models.Product(**product.dict())
     db.add(db_product)
+    db.flush() # Assign the id for the change feed
+    changefeed.record_changes(db, changefeed.PRODUCT, [db_product.id])
     db.commit()
     db.refresh(db_product)
+    cache.invalidate_product_listings(db_product.category_id)
+    typeahead.typeahead_index.product_saved(db_product.id, db_product.name, db_product.quantity, None, db_product.category_id)
     return db_product
 
+# --- Bulk Import Products from CSV/JSONL (Admin Only) ---
+@router.post("/import")
+def import_products(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, description="csv or jsonl; inferred from the file extension if omitted"),
+    chunk_size: int = Query(default=catalog_import.IMPORT_CHUNK_SIZE, ge=1, le=10000),
+    current_user: schemas.UserSchema = Depends(auth.get_current_user),
+    is_admin: bool = Depends(auth.has_role("admin"))
+):
+    """
+    Bulk import products from a CSV or JSONL upload (admin only).
+    Rows are validated and inserted in chunked transactions; rows with an "id" are upserted.
+    Categories may be given as category_id or by category name.
+    Streams newline-delimited JSON events: one per rejected row, one per committed chunk and a final summary.
+    """
+    file_format = catalog_import.detect_format(file.filename, format)
+    if file_format is None:
+        raise HTTPException(status_code=400, detail="Unsupported import format. Use csv or jsonl.")
+
+    def event_stream():
+        db = SessionLocal() # Own session: the response body is produced after the endpoint returns
+        try:
+            for event in catalog_import.import_products(db, file.file, file_format, chunk_size=chunk_size):
+                yield json.dumps(event) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+# --- Bulk Update Product Stock and Price (Admin Only) ---
+@router.put("/bulk", response_model=schemas.ProductBulkUpdateResponse)
+def bulk_update_products(
+    updates: List[schemas.ProductStockPriceUpdate],
+    db: Session = Depends(get_db),
+    current_user: schemas.UserSchema = Depends(auth.get_current_user),
+    is_admin: bool = Depends(auth.has_role("admin"))
+):
+    """
+    Update quantity and/or price of many products at once (admin only).
+    Applies one set-based UPDATE per chunk, each chunk in its own transaction, and reports unknown product ids.
+    """
+    updates_by_id = {} # Later entries for the same id win
+    for update in updates:
+        if update.price is not None and update.price <= 0:
+            raise HTTPException(status_code=400, detail=f"Price must be a positive value (product {update.id})")
+        if update.quantity is not None and update.quantity < 0:
+            raise HTTPException(status_code=400, detail=f"Quantity cannot be negative (product {update.id})")
+        if update.price is not None or update.quantity is not None:
+            updates_by_id[update.id] = update
+
+    product_table = models.Product.__table__
+    product_ids = list(updates_by_id)
+    missing_ids = []
+    affected_category_ids = set()
+    updated = 0
+    for start in range(0, len(product_ids), BULK_UPDATE_CHUNK_SIZE):
+        chunk_ids = product_ids[start:start + BULK_UPDATE_CHUNK_SIZE]
+        existing = dict(
+            db.query(models.Product.id, models.Product.category_id)
+            .filter(models.Product.id.in_(chunk_ids))
+            .all()
+        )
+        missing_ids.extend(product_id for product_id in chunk_ids if product_id not in existing)
+        if not existing:
+            continue
+
+        quantities = {pid: updates_by_id[pid].quantity for pid in existing if updates_by_id[pid].quantity is not None}
+        prices = {pid: updates_by_id[pid].price for pid in existing if updates_by_id[pid].price is not None}
+        values = {}
+        if quantities:
+            values["quantity"] = case(quantities, value=product_table.c.id, else_=product_table.c.quantity)
+        if prices:
+            values["price"] = case(prices, value=product_table.c.id, else_=product_table.c.price)
+        db.execute(product_table.update().where(product_table.c.id.in_(list(existing))).values(**values))
+        changefeed.record_changes(db, changefeed.PRODUCT, existing)
+        db.commit()
+        updated += len(existing)
+        affected_category_ids.update(existing.values())
+        for product_id, quantity in quantities.items():
+            typeahead.typeahead_index.product_stock_changed(product_id, quantity)
+
+    cache.invalidate_product_listings(*affected_category_ids) # Once per batch, not per row
+    return schemas.ProductBulkUpdateResponse(updated=updated, missing_ids=missing_ids)
+
 # --- List Products (Public - with search, filter, pagination) ---
 @router.get("/", response_model=schemas.ProductListResponse)
 def read_products(
@@ -48,11 +197,23 @@ def read_products(
     search: Optional[str] = Query(default=None),
     min_price: Optional[float] = Query(default=None, ge=0), # Price range filter
     max_price: Optional[float] = Query(default=None, ge=0), # Price range filter
+    sort_by: Optional[str] = Query(default=None, regex="^(" + "|".join(PRODUCT_SORT_ORDERS) + ")$"),
+    cursor: Optional[str] = Query(default=None, description="next_cursor of the previous page; replaces skip"),
     db: Session = Depends(get_db)
 ):
     """
-    List products with search, category filter, and pagination (public access).
+    List products with search, category filter, sorting and pagination (public access).
+    Results are always in a stable order (by id unless sort_by is given); use next_cursor for keyset pagination.
+    Responses are cached per normalized query and invalidated when products in the category change.
     """
+    category_id = category_id or None # category_id=0 and search="" have always meant "no filter"
+    search = search or None
+    cache_key = ("products", category_id, search, min_price, max_price, sort_by, cursor, skip, limit)
+    cached_body = cache.product_list_cache.get(cache_key)
+    if cached_body is not None:
+        return serialization.json_response(body=cached_body)
+    cache_generation = cache.product_list_cache.generation() # Before reading, so a concurrent change keeps this page out of the cache
+
     query = db.query(models.Product)
 
     if category_id:
@@ -68,25 +229,165 @@ def read_products(
         query = query.filter(models.Product.price <= max_price)
 
     total_products = query.count()
-    products = query.offset(skip).limit(limit).all()
-
-    product_schemas = []
-    for prod in products:
-        category_schema = schemas.CategorySchema.from_orm(prod.category) # Eagerly load category
-        product_schema = schemas.ProductSchema.from_orm(prod)
-        product_schema.category = category_schema
-        product_schemas.append(product_schema)
-
-
-    return schemas.ProductListResponse(
-        items=product_schemas,
-        total=total_products,
-        skip=skip,
-        limit=limit,
-        category_id_filter=category_id, # Include filter info in response
-        search_query=search # Include search query info in response
+
+    sort_column, descending = PRODUCT_SORT_ORDERS.get(sort_by, (models.Product.id, False))
+    sort_key = (sort_column,) if sort_column is models.Product.id else (sort_column, models.Product.id)
+    if cursor:
+        cursor_value, cursor_id = decode_cursor(cursor)
+        cursor_key = (cursor_id,) if len(sort_key) == 1 else (cursor_value, cursor_id)
+        if descending:
+            query = query.filter(tuple_(*sort_key) < tuple_(*cursor_key))
+        else:
+            query = query.filter(tuple_(*sort_key) > tuple_(*cursor_key))
+    query = query.order_by(*(column.desc() if descending else column.asc() for column in sort_key))
+    if not cursor:
+        query = query.offset(skip)
+    products = query.options(joinedload(models.Product.category)).limit(limit).all() # Eagerly load category
+
+    # Same shape as schemas.ProductListResponse, built once per row and encoded with orjson
+    body = serialization.dumps({
+        "items": [serialization.product_dict(prod) for prod in products],
+        "total": total_products,
+        "skip": skip,
+        "limit": limit,
+        "category_id_filter": category_id, # Include filter info in response
+        "search_query": search, # Include search query info in response
+        "sort_by": sort_by,
+        "next_cursor": encode_cursor(getattr(products[-1], sort_column.key), products[-1].id) if len(products) == limit else None,
+    })
+    cache_tags = [("category", category_id)] if category_id else [cache.ALL_CATEGORIES]
+    cache.product_list_cache.set(cache_key, body, tags=cache_tags, generation=cache_generation)
+    return serialization.json_response(body=body)
+
+# --- Product Listing Cache Metrics (Admin Only) ---
+@router.get("/cache/stats")
+def read_product_cache_stats(
+    current_user: schemas.UserSchema = Depends(auth.get_current_user),
+    is_admin: bool = Depends(auth.has_role("admin"))
+):
+    """
+    Get hit ratio, size in bytes and eviction counters of the product listing cache (admin only).
+    """
+    return cache.product_list_cache.stats()
+
+# --- Export Catalog as NDJSON/CSV (Public - streaming) ---
+@router.get("/export")
+def export_products(
+    format: str = Query(default="ndjson", regex="^(ndjson|csv)$"),
+    gzip: bool = Query(default=False),
+    category_id: Optional[int] = Query(default=None),
+):
+    """
+    Stream the whole catalog (optionally one category) as NDJSON or CSV, optionally gzip-compressed (public access).
+    Products are read with a server-side cursor, so memory use does not grow with the catalog.
+    """
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"catalog.{format}"
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    def body():
+        db = SessionLocal() # Own session: the response body is produced after the endpoint returns
+        try:
+            yield from catalog_export.export_products(db, format, compress=gzip, category_id=category_id)
+        finally:
+            db.close()
+
+    return StreamingResponse(body(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# --- Batch Product Lookup (Public) ---
+@router.get("/batch", response_model=schemas.ProductBatchResponse)
+def read_products_batch(
+    ids: str = Query(..., description="Comma-separated product ids, e.g. 3,1,2"),
+    db: Session = Depends(get_db)
+):
+    """
+    Get many products by id in one request (public access).
+    Products are returned in the requested order; unknown ids are listed in missing_ids.
+    """
+    try:
+        product_ids = [int(product_id) for product_id in ids.split(",") if product_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    return _batch_response(db, product_ids)
+
+@router.post("/batch", response_model=schemas.ProductBatchResponse)
+def read_products_batch_post(batch_request: schemas.ProductBatchRequest, db: Session = Depends(get_db)):
+    """
+    Same as GET /products/batch, for id lists too long for a query string (public access).
+    """
+    return _batch_response(db, batch_request.ids)
+
+# --- Typeahead Suggestions (Public) ---
+@router.get("/suggest", response_model=schemas.TypeaheadResponse)
+def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(default=10, ge=1, le=typeahead.MAX_SUGGESTIONS),
+    db: Session = Depends(get_db)
+):
+    """
+    Autocomplete product and category names by word prefix (public access).
+    Served from an in-memory prefix index; products are ranked by stock, categories by product count.
+    """
+    products, categories = typeahead.typeahead_index.suggest(db, q, limit)
+    return schemas.TypeaheadResponse(
+        query=q,
+        products=[schemas.TypeaheadSuggestionSchema(id=entry_id, name=name, score=score) for entry_id, name, score in products],
+        categories=[schemas.TypeaheadSuggestionSchema(id=entry_id, name=name, score=score) for entry_id, name, score in categories],
     )
 
+# --- Best Sellers and Trending (Public) ---
+@router.get("/rankings", response_model=schemas.ProductRankingResponse)
+def read_product_rankings(
+    kind: str = Query(default="best_sellers", description="best_sellers or trending"),
+    category_id: Optional[int] = None,
+    limit: int = Query(default=10, ge=1, le=rankings.MAX_TOP_K),
+    db: Session = Depends(get_db)
+):
+    """
+    Top-selling products overall or in one category (public access). best_sellers weights sales
+    with a 30-day half-life, trending with a 2-day half-life. The ranking is served from memory;
+    product details are loaded with one batch query.
+    """
+    if kind not in rankings.RANKING_HALF_LIVES:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(rankings.RANKING_HALF_LIVES)}")
+    for _ in range(2):
+        ranked = rankings.product_rankings.top(db, kind, category_id, limit)
+        products = get_products_by_ids(db, [product_id for product_id, _ in ranked])
+        stale = False # Products deleted or moved by a bulk import since the ranking saw them
+        for product_id, _ in ranked:
+            if product_id not in products:
+                rankings.product_rankings.product_deleted(product_id)
+                stale = True
+            elif category_id is not None and products[product_id].category_id != category_id:
+                rankings.product_rankings.product_moved(product_id, products[product_id].category_id)
+                stale = True
+        if not stale:
+            break
+    return serialization.json_response({
+        "kind": kind,
+        "category_id": category_id,
+        "items": [
+            {"score": round(score, 3), "product": serialization.product_dict(products[product_id])}
+            for product_id, score in ranked
+            if product_id in products and (category_id is None or products[product_id].category_id == category_id)
+        ],
+    })
+
+# --- Catalog Change Feed (Public - incremental sync) ---
+@router.get("/changes", response_model=schemas.CatalogChangeFeedResponse)
+def read_catalog_changes(
+    since: int = Query(default=0, ge=0, description="Cursor returned as next_cursor by the previous call; 0 for the full history"),
+    limit: int = Query(default=500, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """
+    List product and category changes (including deletion tombstones) recorded after the `since` cursor, in order (public access).
+    Each entity appears once per page with its current state.
+    """
+    return changefeed.read_changes(db, since, limit)
+
 # --- Get Product by ID (Public) ---
 @router.get("/{product_id}", response_model=schemas.ProductSchema)
 def read_product(product_id: int, db: Session = Depends(get_db)):
@@ -101,6 +402,41 @@ def read_product(product_id: int, db: Session = Depends(get_db)):
     product_schema.category = category_schema
     return product_schema
 
+# --- Get Product Availability (Public) ---
+@router.get("/{product_id}/availability", response_model=schemas.ProductAvailabilitySchema)
+def read_product_availability(product_id: int, db: Session = Depends(get_db)):
+    """
+    Physical stock, stock held by live cart reservations, and what is left to add to a cart.
+    """
+    availability = reservations.available_stock(db, [product_id]).get(product_id)
+    if availability is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return schemas.ProductAvailabilitySchema(product_id=product_id, **availability)
+
+# --- Frequently Bought Together (Public) ---
+@router.get("/{product_id}/recommendations", response_model=schemas.ProductRecommendationResponse)
+def read_product_recommendations(
+    product_id: int,
+    limit: int = Query(default=10, ge=1, le=recommendations.NEIGHBORS_PER_PRODUCT),
+    db: Session = Depends(get_db)
+):
+    """
+    Products most often bought together with this one, best first (public access).
+    Read from the precomputed product_neighbors table, rebuilt daily.
+    """
+    neighbors = recommendations.neighbors_of(db, product_id, limit)
+    if not neighbors and db.query(models.Product.id).filter(models.Product.id == product_id).first() is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    products = get_products_by_ids(db, [neighbor_id for neighbor_id, _, _ in neighbors])
+    return serialization.json_response({
+        "product_id": product_id,
+        "items": [
+            {"score": round(score, 4), "orders": orders, "product": serialization.product_dict(products[neighbor_id])}
+            for neighbor_id, score, orders in neighbors
+            if neighbor_id in products
+        ],
+    })
+
 # --- Update Product (Admin Only) ---
 @router.put("/{product_id}", response_model=schemas.ProductSchema)
 def update_product(
@@ -127,10 +463,15 @@ def update_product(
         raise HTTPException(status_code=400, detail="Quantity cannot be negative")
 
 
+    old_category_id = db_product.category_id
     for field, value in product_update.dict(exclude_unset=True).items():
         setattr(db_product, field, value)
+    changefeed.record_changes(db, changefeed.PRODUCT, [product_id])
     db.commit()
     db.refresh(db_product)
+    cache.invalidate_product_listings(old_category_id, db_product.category_id)
+    typeahead.typeahead_index.product_saved(db_product.id, db_product.name, db_product.quantity, old_category_id, db_product.category_id)
+    rankings.product_rankings.product_moved(db_product.id, db_product.category_id)
     category_schema = schemas.CategorySchema.from_orm(db_product.category) # Eagerly load category
     product_schema = schemas.ProductSchema.from_orm(db_product)
     product_schema.category = category_schema
@@ -150,8 +491,13 @@ def delete_product(
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    category_id = db_product.category_id
     db.delete(db_product)
+    changefeed.record_changes(db, changefeed.PRODUCT, [product_id], deleted=True)
     db.commit()
+    cache.invalidate_product_listings(category_id)
+    typeahead.typeahead_index.product_deleted(product_id, category_id)
+    rankings.product_rankings.product_deleted(product_id)
     return {"message": "Product deleted successfully"}
 
 # --- Update Product Quantity (Admin Only) ---
@@ -175,8 +521,11 @@ def update_product_quantity(
         raise HTTPException(status_code=400, detail="Invalid quantity value. Must be a non-negative integer.")
 
     db_product.quantity = new_quantity
+    changefeed.record_changes(db, changefeed.PRODUCT, [product_id])
     db.commit()
     db.refresh(db_product)
+    cache.invalidate_product_listings(db_product.category_id)
+    typeahead.typeahead_index.product_stock_changed(db_product.id, db_product.quantity)
     category_schema = schemas.CategorySchema.from_orm(db_product.category) # Eagerly load category
     product_schema = schemas.ProductSchema.from_orm(db_product)
     product_schema.category = category_schema
@@ -0,0 +1,245 @@
+# sales_rollups.py
+import sys
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import distinct, func, inspect, select, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+
+ROLLUP_CHUNK_SIZE = 500 # Order ids per IN (...) list when removing orders
+GROUP_BY_OPTIONS = ("day", "month", "category", "product")
+NO_CATEGORY = 0 # sales_daily_products.category_id of lines sold without a category (part of the key, so not NULL)
+
+daily_table = models.SalesDaily.__table__
+category_rollup_table = models.SalesDailyCategory.__table__
+product_rollup_table = models.SalesDailyProduct.__table__
+order_table = models.Order.__table__
+line_item_table = models.OrderLineItem.__table__
+archived_order_table = models.ArchivedOrder.__table__
+archived_line_item_table = models.ArchivedOrderLineItem.__table__
+product_table = models.Product.__table__
+category_table = models.Category.__table__
+
+# A sold line: (order_id, order_date, product_id, category_id at the time of sale, quantity, price)
+SaleLine = Tuple[int, datetime, Optional[int], Optional[int], int, float]
+
+
+def _upsert(db: Session, table, key_columns: List[str], rows: List[dict]) -> None:
+    if not rows:
+        return
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            "units": table.c.units + statement.excluded.units,
+            "revenue": table.c.revenue + statement.excluded.revenue,
+            "orders": table.c.orders + statement.excluded.orders,
+        },
+    )
+    db.execute(statement, rows)
+
+
+def apply_lines(db: Session, lines: Iterable[SaleLine], sign: int) -> None:
+    """
+    Add (sign=1) or subtract (sign=-1) sold lines to the three rollup levels, one executemany upsert
+    per level. Orders are counted once per day, category and product. Lines count in the category
+    they were sold in, so subtracting them later undoes exactly what was added. The caller commits.
+    """
+    days: Dict[date, list] = {} # day -> [units, revenue, order ids]
+    categories: Dict[Tuple[date, int], list] = {}
+    products: Dict[Tuple[date, int, int], list] = {} # (day, product_id, category_id) -> [units, revenue, order ids]
+    for order_id, order_date, product_id, category_id, quantity, price in lines:
+        day = order_date.date()
+        revenue = quantity * price
+        totals = days.setdefault(day, [0, 0.0, set()])
+        totals[0] += quantity
+        totals[1] += revenue
+        totals[2].add(order_id)
+        if category_id is not None:
+            totals = categories.setdefault((day, category_id), [0, 0.0, set()])
+            totals[0] += quantity
+            totals[1] += revenue
+            totals[2].add(order_id)
+        if product_id is not None:
+            totals = products.setdefault((day, product_id, NO_CATEGORY if category_id is None else category_id), [0, 0.0, set()])
+            totals[0] += quantity
+            totals[1] += revenue
+            totals[2].add(order_id)
+
+    _upsert(db, daily_table, ["day"], [
+        {"day": day, "units": sign * units, "revenue": sign * revenue, "orders": sign * len(order_ids)}
+        for day, (units, revenue, order_ids) in days.items()
+    ])
+    _upsert(db, category_rollup_table, ["day", "category_id"], [
+        {"day": day, "category_id": category_id, "units": sign * units, "revenue": sign * revenue, "orders": sign * len(order_ids)}
+        for (day, category_id), (units, revenue, order_ids) in categories.items()
+    ])
+    _upsert(db, product_rollup_table, ["day", "product_id", "category_id"], [
+        {"day": day, "product_id": product_id, "category_id": category_id, "units": sign * units, "revenue": sign * revenue, "orders": sign * len(order_ids)}
+        for (day, product_id, category_id), (units, revenue, order_ids) in products.items()
+    ])
+
+
+def remove_orders(db: Session, order_ids: List[int]) -> list:
+    """
+    Subtract cancelled or deleted orders from the rollups, in the categories recorded on their lines:
+    one joined SELECT per id chunk. Call it while the line items still exist; the caller commits.
+    Returns the subtracted lines as (order_id, order_date, product_id, category_id, quantity, price).
+    """
+    lines = []
+    for start in range(0, len(order_ids), ROLLUP_CHUNK_SIZE):
+        lines.extend(db.execute(
+            select(order_table.c.id, order_table.c.order_date, line_item_table.c.product_id, line_item_table.c.category_id, line_item_table.c.quantity, line_item_table.c.price)
+            .select_from(line_item_table.join(order_table, order_table.c.id == line_item_table.c.order_id))
+            .where(order_table.c.id.in_(order_ids[start:start + ROLLUP_CHUNK_SIZE]))
+        ).all())
+    apply_lines(db, lines, -1)
+    return lines
+
+
+def rebuild(db: Session) -> Dict[str, int]:
+    """
+    Recompute all rollups from current and archived orders and their line items with set-based
+    INSERT ... SELECTs. Cancelled orders are left out and sales count in the category recorded on
+    each line, as in apply_lines. Runs in the caller's transaction, so concurrent checkouts wait for
+    it; the caller commits.
+    """
+    sold_lines = union_all(*(
+        select(source_orders.c.id.label("order_id"), source_orders.c.order_date, source_lines.c.product_id, source_lines.c.category_id, source_lines.c.quantity, source_lines.c.price)
+        .select_from(source_lines.join(source_orders, source_orders.c.id == source_lines.c.order_id))
+        .where(source_orders.c.status != models.OrderStatus.CANCELLED)
+        for source_orders, source_lines in ((order_table, line_item_table), (archived_order_table, archived_line_item_table))
+    )).subquery()
+    day = func.date(sold_lines.c.order_date)
+    units = func.sum(sold_lines.c.quantity)
+    revenue = func.sum(sold_lines.c.quantity * sold_lines.c.price)
+    orders = func.count(distinct(sold_lines.c.order_id))
+    product_category = func.coalesce(sold_lines.c.category_id, NO_CATEGORY)
+
+    for table in (daily_table, category_rollup_table, product_rollup_table):
+        db.execute(table.delete())
+    db.execute(daily_table.insert().from_select(
+        ["day", "units", "revenue", "orders"],
+        select(day, units, revenue, orders).group_by(day),
+    ))
+    db.execute(category_rollup_table.insert().from_select(
+        ["day", "category_id", "units", "revenue", "orders"],
+        select(day, sold_lines.c.category_id, units, revenue, orders)
+        .where(sold_lines.c.category_id.isnot(None)).group_by(day, sold_lines.c.category_id),
+    ))
+    db.execute(product_rollup_table.insert().from_select(
+        ["day", "product_id", "category_id", "units", "revenue", "orders"],
+        select(day, sold_lines.c.product_id, product_category, units, revenue, orders)
+        .where(sold_lines.c.product_id.isnot(None)).group_by(day, sold_lines.c.product_id, product_category),
+    ))
+    return {table.name: db.query(func.count()).select_from(table).scalar() for table in (daily_table, category_rollup_table, product_rollup_table)}
+
+
+
+def upgrade(db: Session, added_columns: Set[str]) -> None:
+    """
+    Startup migration for databases written before line items recorded their category
+    (`added_columns` holds the "table.column" names main.py just added): give those lines their
+    product's current category, re-key sales_daily_products by category and rebuild the rollups.
+    """
+    backfilled = False
+    for table in (line_item_table, archived_line_item_table):
+        if f"{table.name}.category_id" in added_columns:
+            db.execute(table.update().values(
+                category_id=select(product_table.c.category_id).where(product_table.c.id == table.c.product_id).scalar_subquery()
+            ))
+            backfilled = True
+    connection = db.connection()
+    rekeyed = "category_id" not in inspect(connection).get_pk_constraint(product_rollup_table.name)["constrained_columns"]
+    if rekeyed:
+        product_rollup_table.drop(bind=connection)
+        product_rollup_table.create(bind=connection)
+    if backfilled or rekeyed:
+        rebuild(db)
+    db.commit()
+
+
+def _source_table(category_id: Optional[int], product_id: Optional[int]):
+    # The narrowest rollup that can answer the filter exactly
+    if product_id is not None:
+        return product_rollup_table, [product_rollup_table.c.product_id == product_id]
+    if category_id is not None:
+        return category_rollup_table, [category_rollup_table.c.category_id == category_id]
+    return daily_table, []
+
+
+def _totals_row(key, name, units, revenue, orders) -> dict:
+    return {"key": key, "name": name, "units": units or 0, "revenue": round(revenue or 0.0, 2), "orders": orders or 0}
+
+
+def query_sales(
+    db: Session,
+    start: date,
+    end: date,
+    group_by: str,
+    category_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    limit: int = 100,
+) -> dict:
+    """
+    Units, revenue and order counts between `start` and `end` (inclusive), grouped by day, month,
+    category or product (top `limit` by revenue), plus totals. Reads only the rollup tables, so the
+    cost depends on the date range, not on the order history.
+    """
+    source, filters = _source_table(category_id, product_id)
+    in_range = [source.c.day >= start, source.c.day <= end, *filters]
+    sums = (func.sum(source.c.units), func.sum(source.c.revenue), func.sum(source.c.orders))
+    totals = _totals_row(None, None, *db.execute(select(*sums).where(*in_range)).one())
+
+    if group_by in ("day", "month"):
+        key = source.c.day if group_by == "day" else func.strftime("%Y-%m", source.c.day)
+        rows = [_totals_row(str(row_key), None, *row_sums) for row_key, *row_sums in db.execute(select(key, *sums).where(*in_range).group_by(key).order_by(key))]
+    elif group_by == "category":
+        rollup = product_rollup_table if product_id is not None else category_rollup_table
+        revenue = func.sum(rollup.c.revenue)
+        statement = (
+            select(func.nullif(rollup.c.category_id, NO_CATEGORY), category_table.c.name, func.sum(rollup.c.units), revenue, func.sum(rollup.c.orders))
+            .select_from(rollup.outerjoin(category_table, category_table.c.id == rollup.c.category_id))
+            .where(rollup.c.day >= start, rollup.c.day <= end)
+            .group_by(rollup.c.category_id)
+            .order_by(revenue.desc())
+        )
+        if category_id is not None:
+            statement = statement.where(rollup.c.category_id == category_id)
+        if product_id is not None:
+            statement = statement.where(rollup.c.product_id == product_id)
+        rows = [_totals_row(*row) for row in db.execute(statement.limit(limit))]
+    else:
+        rollup = product_rollup_table
+        revenue = func.sum(rollup.c.revenue)
+        statement = (
+            select(rollup.c.product_id, product_table.c.name, func.sum(rollup.c.units), revenue, func.sum(rollup.c.orders))
+            .select_from(rollup.outerjoin(product_table, product_table.c.id == rollup.c.product_id))
+            .where(rollup.c.day >= start, rollup.c.day <= end)
+            .group_by(rollup.c.product_id)
+            .order_by(revenue.desc())
+        )
+        if category_id is not None:
+            statement = statement.where(rollup.c.category_id == category_id)
+        if product_id is not None:
+            statement = statement.where(rollup.c.product_id == product_id)
+        rows = [_totals_row(*row) for row in db.execute(statement.limit(limit))]
+
+    return {"group_by": group_by, "start": start, "end": end, "totals": totals, "rows": rows}
+
+
+if __name__ == "__main__": # python sales_rollups.py rebuild
+    from database import SessionLocal, engine
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python sales_rollups.py rebuild")
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        counts = rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    print("Rebuilt sales rollups: " + ", ".join(f"{name}={count}" for name, count in counts.items()))
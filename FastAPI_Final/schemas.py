@@ -1,7 +1,7 @@
 # schemas.py
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
-from datetime import datetime
+from typing import List, Optional, Union
+from datetime import date, datetime
 
 class RoleSchema(BaseModel):
     id: int
@@ -85,11 +85,27 @@ class ProductUpdateSchema(BaseModel):
     category_id: Optional[int] = None
     image_url: Optional[str] = None # Added image_url
 
+class ProductStockPriceUpdate(BaseModel): # One entry of a bulk stock/price update
+    id: int
+    quantity: Optional[int] = None
+    price: Optional[float] = None
+
+class ProductBulkUpdateResponse(BaseModel):
+    updated: int
+    missing_ids: List[int]
+
 # --- Order Item Schemas (CART ITEM) ---
 class OrderItemCreate(BaseModel): # Renamed from OrderItemCreateSchema
     product_id: int
     quantity: int
 
+class CartItemChange(BaseModel):
+    product_id: int
+    quantity: int # New quantity for the line; 0 removes it
+
+class CartBulkUpdate(BaseModel):
+    items: List[CartItemChange]
+
 class OrderItemSchema(BaseModel): # Renamed from OrderItemSchema
     id: int
     product_id: int
@@ -101,13 +117,25 @@ class OrderItemSchema(BaseModel): # Renamed from OrderItemSchema
     class Config:
         orm_mode = True
 
+class CartSummaryLineSchema(BaseModel):
+    product_id: int
+    quantity: int
+    unit_price: float # Price at the time of cart addition
+    line_total: float
+
+class CartSummarySchema(BaseModel):
+    lines: List[CartSummaryLineSchema]
+    line_count: int
+    item_count: int # Sum of quantities, for the cart badge
+    total: float
+
 # --- Order Line Item Schemas (NEW for ORDERED ITEMS) ---
 class OrderLineItemSchema(BaseModel): # New Schema for OrderLineItem
     id: int
-    product_id: int
+    product_id: Optional[int] # None once the product has been deleted
     quantity: int
     order_id: int # order_id is NOT optional here
-    product: ProductSchema
+    product: Optional[ProductSchema]
 
     class Config:
         orm_mode = True
@@ -130,6 +158,41 @@ class OrderSchema(BaseModel): # Renamed from OrderSchema
         orm_mode = True
 
 
+class OrderSummarySchema(BaseModel): # Order without relationships, totals computed in SQL
+    id: int
+    user_id: int
+    order_date: datetime
+    status: str
+    line_count: int
+    item_count: int
+    total: float
+
+class OrderStatusResultSchema(BaseModel):
+    id: int
+    result: str # "updated", "unchanged", "not_found" or "invalid_transition"
+    status: Optional[str] = None # Status of the order after the request
+
+class OrderStatusBulkResponse(BaseModel):
+    updated: int
+    results: List[OrderStatusResultSchema] # In request order
+
+
+# --- Sales Analytics Schemas ---
+class SalesRollupRowSchema(BaseModel):
+    key: Optional[Union[int, str]] = None # Day ("2024-05-01"), month ("2024-05"), category id or product id
+    name: Optional[str] = None # Category or product name
+    units: int
+    revenue: float
+    orders: int
+
+class SalesAnalyticsResponse(BaseModel):
+    group_by: str
+    start: date
+    end: date
+    totals: SalesRollupRowSchema
+    rows: List[SalesRollupRowSchema]
+
+
 class FavoriteProductSchema(BaseModel):
     id: int
     product: ProductSchema
@@ -154,6 +217,67 @@ class ProductListResponse(BaseModel):
     limit: int
     category_id_filter: Optional[int] = None # To reflect applied filters
     search_query: Optional[str] = None # To reflect applied search query
+    sort_by: Optional[str] = None # To reflect applied sort order
+    next_cursor: Optional[str] = None # Pass as `cursor` to fetch the next page (keyset pagination)
+
+# --- Batch Product Lookup Schemas ---
+class ProductBatchRequest(BaseModel):
+    ids: List[int]
+
+class ProductBatchResponse(BaseModel):
+    items: List[ProductSchema] # In the order requested
+    missing_ids: List[int]
+
+class ProductAvailabilitySchema(BaseModel):
+    product_id: int
+    quantity: int # Physical stock
+    held: int # Reserved by live cart holds
+    available: int
+
+# --- Typeahead Schemas ---
+class TypeaheadSuggestionSchema(BaseModel):
+    id: int
+    name: str
+    score: int # Stock for products, product count for categories
+
+class TypeaheadResponse(BaseModel):
+    query: str
+    products: List[TypeaheadSuggestionSchema]
+    categories: List[TypeaheadSuggestionSchema]
+
+# --- Product Ranking Schemas ---
+class RankedProductSchema(BaseModel):
+    score: float # Units sold, with older sales weighted down by the ranking's half-life
+    product: ProductSchema
+
+class ProductRankingResponse(BaseModel):
+    kind: str # "best_sellers" or "trending"
+    category_id: Optional[int] = None
+    items: List[RankedProductSchema]
+
+class RecommendedProductSchema(BaseModel):
+    score: float # Cosine similarity or lift between the two products' order sets
+    orders: int # Orders that contained both products
+    product: ProductSchema
+
+class ProductRecommendationResponse(BaseModel):
+    product_id: int
+    items: List[RecommendedProductSchema]
+
+# --- Catalog Change Feed Schemas ---
+class CatalogChangeSchema(BaseModel):
+    seq: int # Change sequence number
+    entity: str # "product" or "category"
+    id: int
+    deleted: bool # True for tombstones
+    changed_at: datetime
+    product: Optional[ProductSchema] = None # Current state for product upserts
+    category: Optional[CategorySchema] = None # Current state for category upserts
+
+class CatalogChangeFeedResponse(BaseModel):
+    changes: List[CatalogChangeSchema]
+    next_cursor: int # Pass as `since` to fetch the next page
+    has_more: bool
 
 # --- Registration Request Schemas  ---
 class CustomerRegistrationRequest(BaseModel):
@@ -0,0 +1,94 @@
+# serialization.py
+# Fast path for list endpoints: build plain dicts straight from ORM rows (same shape as the
+# pydantic response schemas) and encode them once with orjson, instead of from_orm() per row
+# followed by FastAPI re-validating the whole response_model and encoding with the stdlib.
+from typing import Any, Dict, Optional, Set
+
+import orjson
+from fastapi import Response
+
+import models
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(content: Any = None, body: Optional[bytes] = None, status_code: int = 200) -> Response:
+    """
+    Return already-serialized JSON; FastAPI passes Response objects through without validation.
+    """
+    return Response(content=body if body is not None else dumps(content), status_code=status_code, media_type="application/json")
+
+
+def category_dict(category: Optional[models.Category], product_count: int = 0) -> Optional[dict]:
+    # Mirrors schemas.CategorySchema
+    if category is None:
+        return None
+    return {"id": category.id, "name": category.name, "product_count": product_count}
+
+
+def product_dict(product: models.Product) -> dict:
+    # Mirrors schemas.ProductSchema; load the category relationship eagerly to avoid a query per row
+    return {
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "quantity": product.quantity,
+        "category": category_dict(product.category),
+        "image_url": product.image_url,
+    }
+
+
+def user_dict(user: models.User) -> dict:
+    # Mirrors schemas.UserSchema; load the roles relationship eagerly
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "is_active": user.is_active,
+        "roles": [{"id": role.id, "name": role.name} for role in user.roles],
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "created_at": getattr(user, "created_at", None),
+    }
+
+
+def order_line_item_dict(item: models.OrderLineItem, with_product: bool = True) -> dict:
+    # Mirrors schemas.OrderLineItemSchema
+    data = {
+        "id": item.id,
+        "product_id": item.product_id,
+        "quantity": item.quantity,
+        "order_id": item.order_id,
+    }
+    if with_product:
+        data["product"] = product_dict(item.product) if item.product is not None else None # Product deleted since
+    return data
+
+
+def order_dict(order: models.Order, user_dicts: Dict[int, dict], fields: Optional[Set[str]] = None) -> dict:
+    """
+    Mirrors schemas.OrderSchema, restricted to `fields` when given (relationships not listed are
+    never touched, so they need not be loaded). `user_dicts` memoizes users by id across a page, so
+    a customer with many orders is converted once and the same dict is reused for each order.
+    """
+    data = {}
+    if fields is None or "id" in fields:
+        data["id"] = order.id
+    if fields is None or "user_id" in fields:
+        data["user_id"] = order.user_id
+    if fields is None or "order_date" in fields:
+        data["order_date"] = order.order_date
+    if fields is None or "status" in fields:
+        data["status"] = order.status.value if order.status is not None else None
+    if fields is None or "order_line_items" in fields:
+        with_products = fields is None or "order_line_items.product" in fields
+        data["order_line_items"] = [order_line_item_dict(item, with_products) for item in order.order_line_items]
+    if fields is None or "user" in fields:
+        user = user_dicts.get(order.user_id)
+        if user is None and order.user is not None:
+            user = user_dicts[order.user_id] = user_dict(order.user)
+        data["user"] = user
+    return data
\ No newline at end of file
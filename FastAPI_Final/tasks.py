@@ -0,0 +1,51 @@
+# tasks.py
+import asyncio
+import traceback
+from typing import Callable, Coroutine, List
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+
+_running_tasks: List[asyncio.Task] = []
+
+
+async def run_periodically(interval_seconds: float, job: Callable[[Session], object]) -> None:
+    """
+    Run a blocking database job every `interval_seconds` in the threadpool, each time with its own session.
+    Errors are logged and the loop keeps going.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await loop.run_in_executor(None, _run_job, job)
+
+
+def _run_job(job: Callable[[Session], object]) -> None:
+    db = SessionLocal()
+    try:
+        job(db)
+    except Exception:
+        db.rollback()
+        print(f"Background job {job.__name__} failed:\n{traceback.format_exc()}") # Log details for debugging
+    finally:
+        db.close()
+
+
+async def run_once(job: Callable[[Session], object]) -> None:
+    await asyncio.get_running_loop().run_in_executor(None, _run_job, job)
+
+
+def start_periodic(interval_seconds: float, job: Callable[[Session], object]) -> None:
+    start(run_periodically(interval_seconds, job))
+
+
+def start(coroutine: Coroutine) -> None:
+    _running_tasks.append(asyncio.create_task(coroutine))
+
+
+async def stop_all() -> None:
+    for task in _running_tasks:
+        task.cancel()
+    await asyncio.gather(*_running_tasks, return_exceptions=True)
+    _running_tasks.clear()
@@ -0,0 +1,67 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app imports its modules flat and opens ./database.db: run it from a scratch directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="fastapi-final-tests-"))
+
+from fastapi import Request # noqa: E402
+from fastapi.testclient import TestClient # noqa: E402
+from sqlalchemy import event # noqa: E402
+
+import auth # noqa: E402
+import cache # noqa: E402
+import database # noqa: E402
+import main # noqa: E402
+import models # noqa: E402
+import rankings # noqa: E402
+
+
+def _test_user(request: Request) -> auth.TokenData:
+    # Stands in for the Keycloak token: the X-Test-User header names the user, "admin" by default
+    username = request.headers.get("X-Test-User", "admin")
+    roles = ["admin"] if username == "admin" else ["customer"]
+    return auth.TokenData(username=username, email=f"{username}@example.com", roles=roles, token="test")
+
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    rankings.product_rankings = rankings.ProductRankings()
+    cache.product_list_cache.clear()
+    cache.cart_summary_cache.clear()
+    yield
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client():
+    main.app.dependency_overrides[auth.get_current_user] = _test_user
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def statements():
+    """
+    SQL statements sent to the database while the test runs; clear() it before the part to measure.
+    """
+    executed = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(database.engine, "before_cursor_execute", record)
@@ -0,0 +1,52 @@
+# tests/test_checkout_concurrency.py
+import threading
+
+from fastapi.testclient import TestClient
+
+import main
+import models
+
+CUSTOMERS = 40
+STOCK = 25
+UNITS_PER_CART = 2
+
+
+def test_parallel_checkouts_never_oversell(client, db):
+    category = models.Category(name="category")
+    db.add(category)
+    db.flush()
+    scarce = models.Product(name="scarce", price=5.0, quantity=STOCK, category_id=category.id)
+    plenty = models.Product(name="plenty", price=1.0, quantity=1000, category_id=category.id)
+    db.add_all([scarce, plenty])
+    customers = [models.User(username=f"cust{number}", email=f"cust{number}@example.com") for number in range(CUSTOMERS)]
+    db.add_all(customers)
+    db.flush()
+    # Carts written directly: adding through the API would hold stock and turn late customers away before checkout
+    for customer in customers:
+        db.add(models.OrderItem(user_id=customer.id, product_id=scarce.id, quantity=UNITS_PER_CART, price=scarce.price))
+        db.add(models.OrderItem(user_id=customer.id, product_id=plenty.id, quantity=1, price=plenty.price))
+    db.commit()
+
+    statuses = []
+    start = threading.Barrier(CUSTOMERS)
+
+    def checkout(number):
+        thread_client = TestClient(main.app)
+        start.wait()
+        statuses.append(thread_client.post("/orders/", json={}, headers={"X-Test-User": f"cust{number}"}).status_code)
+
+    threads = [threading.Thread(target=checkout, args=(number,)) for number in range(CUSTOMERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db.expire_all()
+    placed = statuses.count(201)
+    assert placed == STOCK // UNITS_PER_CART
+    assert set(statuses) <= {201, 400} # Everyone else is told the stock ran out
+    assert db.get(models.Product, scarce.id).quantity == STOCK - placed * UNITS_PER_CART
+    assert db.get(models.Product, plenty.id).quantity == 1000 - placed
+    assert db.query(models.Order).count() == placed
+    assert db.query(models.OrderLineItem).filter(models.OrderLineItem.product_id == scarce.id).count() == placed
+    assert db.query(models.OrderItem).count() == 2 * (CUSTOMERS - placed) # Failed checkouts keep their carts
@@ -0,0 +1,73 @@
+# tests/test_order_queries.py
+import pytest
+
+import models
+
+CUSTOMERS = ("cust0", "cust1")
+
+
+def _user(db, username, role):
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if user is None:
+        user = models.User(username=username, email=f"{username}@example.com", roles=[role])
+        db.add(user)
+    return user
+
+
+def _add_orders(db, count, lines_per_order=3):
+    # Every order gets new products in a new category, so per-row lazy loads would show up as extra queries
+    customer_role = db.query(models.Role).filter(models.Role.name == "customer").first()
+    if customer_role is None:
+        customer_role = models.Role(name="customer")
+        db.add(customer_role)
+    _user(db, "admin", customer_role) # Endpoints look the caller up in the local users table
+    users = [_user(db, username, customer_role) for username in CUSTOMERS]
+    db.flush()
+    for number in range(count):
+        category = models.Category(name=f"category {db.query(models.Category).count()}")
+        db.add(category)
+        db.flush()
+        order = models.Order(user_id=users[number % len(users)].id, status=models.OrderStatus.PENDING)
+        db.add(order)
+        db.flush()
+        for line in range(lines_per_order):
+            product = models.Product(name=f"product {category.id}-{line}", price=2.5, quantity=10, category_id=category.id)
+            db.add(product)
+            db.flush()
+            db.add(models.OrderLineItem(order_id=order.id, product_id=product.id, category_id=category.id, quantity=1, price=2.5))
+    db.commit()
+    return users[0].id
+
+
+def _get(client, statements, url, user="admin"):
+    statements.clear()
+    response = client.get(url, headers={"X-Test-User": user})
+    assert response.status_code == 200, response.text
+    return len(statements), response.json()
+
+
+@pytest.mark.parametrize("url, user", [
+    ("/orders/", "admin"),
+    ("/orders/admin/customer/{customer_id}/", "admin"),
+    ("/orders/customer/me/", CUSTOMERS[0]),
+])
+def test_order_list_statement_count_does_not_grow_with_the_page(client, db, statements, url, user):
+    customer_id = _add_orders(db, 2)
+    small_count, small_page = _get(client, statements, url.format(customer_id=customer_id), user)
+    _add_orders(db, 40)
+    large_count, large_page = _get(client, statements, url.format(customer_id=customer_id), user)
+
+    assert len(large_page) > len(small_page)
+    assert all(line["product"]["category"] for order in large_page for line in order["order_line_items"])
+    assert large_count == small_count
+    assert large_count <= 8 # Order page, user, roles, line items, products, categories (+ local user lookup)
+
+
+def test_order_detail_statement_count_does_not_grow_with_the_lines(client, db, statements):
+    _add_orders(db, 1, lines_per_order=1)
+    small_count, _ = _get(client, statements, "/orders/1")
+    _add_orders(db, 1, lines_per_order=25)
+    large_count, order = _get(client, statements, "/orders/2")
+
+    assert len(order["order_line_items"]) == 25
+    assert large_count == small_count
@@ -0,0 +1,76 @@
+# tests/test_outbox.py
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import orjson
+import pytest
+
+import models
+import outbox
+
+WAREHOUSE = "http://warehouse.test/hooks/orders"
+CRM = "http://crm.test/hooks/orders"
+
+
+class Receiver:
+    """
+    Webhook endpoints behind an httpx.MockTransport; endpoints in `down` fail with `failure`.
+    """
+
+    def __init__(self, failure):
+        self.failure = failure
+        self.down = set()
+        self.received = {WAREHOUSE: [], CRM: []}
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        endpoint = str(request.url)
+        if endpoint in self.down:
+            if self.failure == "connect":
+                raise httpx.ConnectError("connection refused", request=request)
+            return httpx.Response(503, text="maintenance")
+        self.received[endpoint].append([event["id"] for event in orjson.loads(request.content)["events"]])
+        return httpx.Response(204)
+
+    def dispatch(self) -> int:
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(self)) as client:
+                return await outbox.dispatch_once(client)
+        return asyncio.run(run())
+
+
+def _events(db, endpoint):
+    db.expire_all()
+    return db.query(models.OutboxEvent).filter(models.OutboxEvent.endpoint == endpoint).order_by(models.OutboxEvent.id).all()
+
+
+@pytest.mark.parametrize("failure", ["http", "connect"])
+def test_dispatch_marks_delivered_and_retries_failed_endpoints(db, monkeypatch, failure):
+    monkeypatch.setattr(outbox, "WEBHOOK_ENDPOINTS", [WAREHOUSE, CRM])
+    outbox.record_events(db, outbox.ORDER_CREATED, [{"order_id": 1}, {"order_id": 2}])
+    db.commit()
+    event_ids = [event.event_id for event in _events(db, WAREHOUSE)]
+    receiver = Receiver(failure)
+    receiver.down.add(CRM)
+
+    before = datetime.utcnow()
+    assert receiver.dispatch() == 4
+    assert receiver.received[WAREHOUSE] == [event_ids] # One POST per endpoint per round
+    assert all(event.delivered_at is not None and event.attempts == 0 for event in _events(db, WAREHOUSE))
+    for event in _events(db, CRM):
+        assert event.delivered_at is None
+        assert event.attempts == 1
+        assert event.next_attempt_at > before
+        assert event.last_error.startswith("HTTP 503" if failure == "http" else "ConnectError")
+
+    assert receiver.dispatch() == 0 # Backing off; delivered events are not sent again
+    assert receiver.received == {WAREHOUSE: [event_ids], CRM: []}
+
+    receiver.down.clear()
+    for event in _events(db, CRM): # The backoff has passed
+        event.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert receiver.dispatch() == 2
+    assert receiver.received == {WAREHOUSE: [event_ids], CRM: [event_ids]}
+    assert all(event.delivered_at is not None and event.attempts == 1 for event in _events(db, CRM))
+    assert receiver.dispatch() == 0
@@ -0,0 +1,71 @@
+# tests/test_product_list_benchmark.py
+# CPU cost of serializing one 100-item product page: the former pydantic path (from_orm per row,
+# ProductListResponse, .json()) against serialization.product_dict + orjson used by read_products.
+# Opt-in: BENCHMARK=1 python -m pytest -q -s tests/test_product_list_benchmark.py
+import json
+import os
+import time
+
+import pytest
+from sqlalchemy.orm import joinedload
+
+import models
+import schemas
+import serialization
+
+PAGE_SIZE = 100
+ROUNDS = 300
+
+pytestmark = pytest.mark.skipif(not os.environ.get("BENCHMARK"), reason="set BENCHMARK=1 to run benchmarks")
+
+
+def _pydantic_page(products) -> bytes:
+    product_schemas = []
+    for prod in products:
+        category_schema = schemas.CategorySchema.from_orm(prod.category)
+        product_schema = schemas.ProductSchema.from_orm(prod)
+        product_schema.category = category_schema
+        product_schemas.append(product_schema)
+    response = schemas.ProductListResponse(items=product_schemas, total=len(products), skip=0, limit=PAGE_SIZE)
+    return response.json().encode("utf-8")
+
+
+def _orjson_page(products) -> bytes:
+    return serialization.dumps({
+        "items": [serialization.product_dict(prod) for prod in products],
+        "total": len(products),
+        "skip": 0,
+        "limit": PAGE_SIZE,
+        "category_id_filter": None,
+        "search_query": None,
+        "sort_by": None,
+        "next_cursor": None,
+    })
+
+
+def _cpu_ms(serialize, products) -> float:
+    for _ in range(20): # Warm up
+        serialize(products)
+    started = time.process_time()
+    for _ in range(ROUNDS):
+        serialize(products)
+    return (time.process_time() - started) / ROUNDS * 1000
+
+
+def test_product_page_serialization_cpu(db):
+    categories = [models.Category(name=f"category {number}") for number in range(5)]
+    db.add_all(categories)
+    db.flush()
+    db.add_all(
+        models.Product(name=f"product {number}", description="A product description of typical length.", price=9.99 + number,
+                       quantity=number, category_id=categories[number % len(categories)].id, image_url=f"https://img.example.com/{number}.png")
+        for number in range(PAGE_SIZE)
+    )
+    db.commit()
+    products = db.query(models.Product).options(joinedload(models.Product.category)).order_by(models.Product.id).limit(PAGE_SIZE).all()
+    assert json.loads(_pydantic_page(products)) == json.loads(_orjson_page(products)) # Same response, byte encoding aside
+
+    before = _cpu_ms(_pydantic_page, products)
+    after = _cpu_ms(_orjson_page, products)
+    print(f"\n{PAGE_SIZE}-item product page, CPU per serialization: pydantic {before:.2f} ms, orjson {after:.2f} ms ({before / after:.1f}x)")
+    assert after < before
@@ -0,0 +1,56 @@
+# tests/test_product_list_plans.py
+import pytest
+from sqlalchemy import event
+
+import database
+import models
+from routers.products import PRODUCT_SORT_ORDERS
+
+
+@pytest.fixture
+def category_id(db):
+    categories = [models.Category(name=f"category {number}") for number in range(2)]
+    db.add_all(categories)
+    db.flush()
+    for number in range(10):
+        db.add(models.Product(name=f"product {number % 4}", price=1.0 + number % 3, quantity=number % 5, category_id=categories[number % 2].id))
+    db.commit()
+    return categories[0].id
+
+
+def _list_products(client, params):
+    # Returns the page and the query plan of its products SELECT, explained with the parameters it ran with
+    queries = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("SELECT") and "FROM products" in statement and "ORDER BY" in statement:
+            queries.append((statement, parameters))
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/products/", params=params)
+    finally:
+        event.remove(database.engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.text
+    assert len(queries) == 1
+    statement, parameters = queries[0]
+    with database.engine.connect() as connection:
+        plan = [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+    return response.json(), plan
+
+
+@pytest.mark.parametrize("filtered", [False, True], ids=["all", "category"])
+@pytest.mark.parametrize("sort_by", [None, *PRODUCT_SORT_ORDERS])
+def test_listing_pages_are_read_in_index_order(client, category_id, sort_by, filtered):
+    params = {"limit": 2}
+    if sort_by:
+        params["sort_by"] = sort_by
+    if filtered:
+        params["category_id"] = category_id
+
+    first_page, plan = _list_products(client, params)
+    assert not any("USE TEMP B-TREE" in step for step in plan), plan
+    assert first_page["next_cursor"]
+
+    _, plan = _list_products(client, {**params, "cursor": first_page["next_cursor"]})
+    assert not any("USE TEMP B-TREE" in step for step in plan), plan
@@ -0,0 +1,52 @@
+# tests/test_rankings.py
+import pytest
+
+import models
+import rankings
+
+
+def _checkout(client, db, username, quantities):
+    if db.query(models.User).filter(models.User.username == username).first() is None:
+        db.add(models.User(username=username, email=f"{username}@example.com"))
+        db.commit()
+    for product_id, quantity in quantities.items():
+        response = client.post("/orders/items/", json={"product_id": product_id, "quantity": quantity}, headers={"X-Test-User": username})
+        assert response.status_code == 201, response.text
+    response = client.post("/orders/", json={}, headers={"X-Test-User": username})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def _scores(db, kind, category_id=None):
+    return {product_id: round(score, 6) for product_id, score in rankings.product_rankings.top(db, kind, category_id, rankings.MAX_TOP_K)}
+
+
+@pytest.mark.parametrize("remove", ["cancel", "delete"])
+def test_removed_orders_leave_the_rankings(client, db, remove):
+    db.add(models.User(username="admin", email="admin@example.com"))
+    category = models.Category(name="category")
+    db.add(category)
+    db.flush()
+    products = [models.Product(name=f"product {number}", price=1.0, quantity=100, category_id=category.id) for number in range(3)]
+    db.add_all(products)
+    db.commit()
+    first, second, third = (product.id for product in products)
+
+    removed_order_id = _checkout(client, db, "cust0", {first: 5, second: 1})
+    _checkout(client, db, "cust1", {first: 1, second: 2, third: 3})
+    for kind in rankings.RANKING_HALF_LIVES:
+        assert list(_scores(db, kind)) == [first, third, second] # Top lists built before the removal
+
+    if remove == "cancel":
+        response = client.put(f"/orders/{removed_order_id}/status/", json={"status": "cancelled"})
+    else:
+        response = client.delete(f"/orders/{removed_order_id}")
+    assert response.status_code == 200, response.text
+
+    live = {kind: (_scores(db, kind), _scores(db, kind, category.id)) for kind in rankings.RANKING_HALF_LIVES}
+    rankings.product_rankings = rankings.ProductRankings() # Bootstrapped from the rollups, which leave the order out
+    for kind in rankings.RANKING_HALF_LIVES:
+        assert live[kind][0] == pytest.approx({third: 3, second: 2, first: 1}, rel=1e-3) # Units sold just now
+        assert list(live[kind][0]) == [third, second, first]
+        assert live[kind][0] == live[kind][1]
+        assert list(_scores(db, kind)) == list(live[kind][0])
@@ -0,0 +1,220 @@
+# typeahead.py
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+
+MAX_SUGGESTIONS = 20
+MEMO_MIN_MATCHES = 256 # Prefixes matching more keys than this keep a maintained top-k list
+_MEMO_SIZE = 2 * MAX_SUGGESTIONS # Slack so score drops rarely force a recomputation
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall(text.casefold()))
+
+
+def _index_keys(name: str) -> List[str]:
+    """
+    Every word start of a name is indexed, so "shi" finds "Red Cotton Shirt".
+    """
+    words = normalize(name).split(" ")
+    return list(dict.fromkeys(" ".join(words[i:]) for i in range(len(words)) if words[i]))
+
+
+def _prefixes(name: str) -> Set[str]:
+    return {key[:length] for key in _index_keys(name) for length in range(1, len(key) + 1)}
+
+
+def _rank(entry_id: int, score: int) -> Tuple[int, int]:
+    return (score, -entry_id) # Highest score first, then oldest id
+
+
+class _TopK:
+    """
+    Top-ranked entries for one prefix. Every entry kept ranks at or above `floor`, and every
+    matching entry that is not kept ranks at or below it, so the list stays exact under updates.
+    """
+
+    def __init__(self, ranked: List[Tuple[int, int]], floor: Tuple[int, int]):
+        self.ranks = dict(ranked) # entry id -> rank
+        self.floor = floor
+
+    def update(self, entry_id: int, rank: Optional[Tuple[int, int]]) -> bool:
+        """
+        Apply a new rank (None for removal). Returns False when the list can no longer be trusted.
+        """
+        if rank is None or rank < self.floor:
+            if entry_id in self.ranks:
+                del self.ranks[entry_id]
+                if rank is not None:
+                    self.floor = max(self.floor, rank)
+        elif entry_id in self.ranks or rank > self.floor:
+            self.ranks[entry_id] = rank
+            if len(self.ranks) > _MEMO_SIZE:
+                dropped_id = min(self.ranks, key=self.ranks.get)
+                self.floor = max(self.floor, self.ranks.pop(dropped_id))
+        return len(self.ranks) >= MAX_SUGGESTIONS
+
+    def top(self, limit: int) -> List[int]:
+        return heapq.nlargest(limit, self.ranks, key=self.ranks.get)
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, id) pairs searched with bisect. A prefix query is two binary searches
+    plus a top-k selection over the matching range; prefixes matching many keys keep their
+    top-k list up to date on every write instead of rescanning the range.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, int]] = []
+        self._entries: Dict[int, Tuple[str, int]] = {} # id -> (display name, score)
+        self._memo: Dict[str, _TopK] = {}
+
+    def load(self, entries: Iterable[Tuple[int, str, int]]) -> None:
+        self._entries = {entry_id: (name, score or 0) for entry_id, name, score in entries}
+        self._keys = sorted((key, entry_id) for entry_id, (name, _) in self._entries.items() for key in _index_keys(name))
+        self._memo.clear()
+
+    def upsert(self, entry_id: int, name: str, score: int) -> None:
+        old = self._entries.get(entry_id)
+        if old is not None and old[0] != name:
+            self.remove(entry_id)
+            old = None
+        self._entries[entry_id] = (name, score or 0)
+        if old is None:
+            for key in _index_keys(name):
+                insort(self._keys, (key, entry_id))
+        self._refresh_memo(entry_id, name, _rank(entry_id, score or 0))
+
+    def update_score(self, entry_id: int, score: int) -> None:
+        entry = self._entries.get(entry_id)
+        if entry is not None and entry[1] != (score or 0):
+            self._entries[entry_id] = (entry[0], score or 0)
+            self._refresh_memo(entry_id, entry[0], _rank(entry_id, score or 0))
+
+    def adjust_score(self, entry_id: int, delta: int) -> None:
+        entry = self._entries.get(entry_id)
+        if entry is not None:
+            self.update_score(entry_id, entry[1] + delta)
+
+    def remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in _index_keys(entry[0]):
+            position = bisect_left(self._keys, (key, entry_id))
+            if position < len(self._keys) and self._keys[position] == (key, entry_id):
+                del self._keys[position]
+        self._refresh_memo(entry_id, entry[0], None)
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[int, str, int]]:
+        """
+        Return up to `limit` (id, name, score) matches for a normalized prefix, highest score first.
+        """
+        top_k = self._memo.get(prefix)
+        if top_k is None:
+            start = bisect_left(self._keys, (prefix,))
+            end = bisect_left(self._keys, (prefix + "\U0010ffff",))
+            matched_ids = {entry_id for _, entry_id in self._keys[start:end]}
+            if len(matched_ids) <= MEMO_MIN_MATCHES:
+                ranked = heapq.nlargest(limit, matched_ids, key=lambda entry_id: _rank(entry_id, self._entries[entry_id][1]))
+                return [(entry_id, *self._entries[entry_id]) for entry_id in ranked]
+            ranked = heapq.nlargest(_MEMO_SIZE + 1, ((entry_id, _rank(entry_id, self._entries[entry_id][1])) for entry_id in matched_ids), key=lambda item: item[1])
+            top_k = self._memo[prefix] = _TopK(ranked[:_MEMO_SIZE], ranked[_MEMO_SIZE][1])
+        return [(entry_id, *self._entries[entry_id]) for entry_id in top_k.top(limit)]
+
+    def _refresh_memo(self, entry_id: int, name: str, rank: Optional[Tuple[int, int]]) -> None:
+        for prefix in _prefixes(name):
+            top_k = self._memo.get(prefix)
+            if top_k is not None and not top_k.update(entry_id, rank):
+                del self._memo[prefix] # Recomputed on the next query
+
+
+class TypeaheadIndex:
+    """
+    In-memory prefix indexes over product names (ranked by stock) and category names
+    (ranked by product count). Built lazily from the database and updated incrementally by writers.
+    """
+
+    def __init__(self):
+        self.products = PrefixIndex()
+        self.categories = PrefixIndex()
+        self.loaded = False
+        self._lock = threading.RLock()
+
+    def ensure_loaded(self, db: Session) -> None:
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            self.products.load(db.query(models.Product.id, models.Product.name, models.Product.quantity))
+            product_counts = dict(
+                db.query(models.Product.category_id, func.count(models.Product.id)).group_by(models.Product.category_id)
+            )
+            self.categories.load(
+                (category_id, name, product_counts.get(category_id, 0))
+                for category_id, name in db.query(models.Category.id, models.Category.name)
+            )
+            self.loaded = True
+
+    def invalidate(self) -> None:
+        """
+        Force a rebuild on the next query (used after bulk writes).
+        """
+        with self._lock:
+            self.loaded = False
+
+    def suggest(self, db: Session, query: str, limit: int) -> Tuple[List[Tuple[int, str, int]], List[Tuple[int, str, int]]]:
+        self.ensure_loaded(db)
+        prefix = normalize(query)
+        if not prefix:
+            return [], []
+        with self._lock:
+            return self.products.search(prefix, limit), self.categories.search(prefix, limit)
+
+    # --- Incremental updates (no-ops until the index has been built) ---
+    def product_saved(self, product_id: int, name: str, quantity: Optional[int], old_category_id: Optional[int] = None, new_category_id: Optional[int] = None) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            self.products.upsert(product_id, name, quantity)
+            if old_category_id != new_category_id:
+                if old_category_id is not None:
+                    self.categories.adjust_score(old_category_id, -1)
+                if new_category_id is not None:
+                    self.categories.adjust_score(new_category_id, 1)
+
+    def product_stock_changed(self, product_id: int, quantity: int) -> None:
+        with self._lock:
+            if self.loaded:
+                self.products.update_score(product_id, quantity)
+
+    def product_deleted(self, product_id: int, category_id: Optional[int]) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            self.products.remove(product_id)
+            if category_id is not None:
+                self.categories.adjust_score(category_id, -1)
+
+    def category_saved(self, category_id: int, name: str, product_count: int) -> None:
+        with self._lock:
+            if self.loaded:
+                self.categories.upsert(category_id, name, product_count)
+
+    def category_deleted(self, category_id: int) -> None:
+        with self._lock:
+            if self.loaded:
+                self.categories.remove(category_id)
+
+
+typeahead_index = TypeaheadIndex()